@@ -41,10 +41,20 @@
 # 
 
 import jarray
-import inspect
+import sys
 import os
-import subprocess
 import time
+import json
+import urllib
+import urllib2
+import threading
+import Queue
+import struct
+import datetime
+import calendar
+import hashlib
+import zlib
+import base64
 
 from javax.swing import JCheckBox
 from javax.swing import JButton
@@ -61,16 +71,18 @@ from javax.swing.filechooser import FileNameExtensionFilter
 
 from java.lang import Class
 from java.lang import System
+from java.lang import Runtime
 from java.sql  import DriverManager, SQLException
 from java.util.logging import Level
-from java.io import File
+from java.util import ArrayList
 from org.sleuthkit.datamodel import SleuthkitCase
 from org.sleuthkit.datamodel import AbstractFile
 from org.sleuthkit.datamodel import ReadContentInputStream
 from org.sleuthkit.datamodel import BlackboardArtifact
 from org.sleuthkit.datamodel import BlackboardAttribute
+from org.sleuthkit.datamodel import TskCoreException
+from org.sleuthkit.datamodel import TskDataException
 from org.sleuthkit.autopsy.ingest import IngestModule
-from org.sleuthkit.autopsy.ingest.IngestModule import IngestModuleException
 from org.sleuthkit.autopsy.ingest import DataSourceIngestModule
 from org.sleuthkit.autopsy.ingest import IngestModuleFactoryAdapter
 from org.sleuthkit.autopsy.ingest import IngestModuleIngestJobSettings
@@ -79,11 +91,1169 @@ from org.sleuthkit.autopsy.ingest import IngestMessage
 from org.sleuthkit.autopsy.ingest import IngestServices
 from org.sleuthkit.autopsy.ingest import ModuleDataEvent
 from org.sleuthkit.autopsy.coreutils import Logger
-from org.sleuthkit.autopsy.coreutils import PlatformUtil
 from org.sleuthkit.autopsy.casemodule import Case
 from org.sleuthkit.autopsy.casemodule.services import Services
 from org.sleuthkit.autopsy.casemodule.services import FileManager
-from org.sleuthkit.autopsy.datamodel import ContentUtils
+
+
+# The SQLite JDBC driver is registered once, when Autopsy loads the module
+Class.forName("org.sqlite.JDBC").newInstance()
+
+
+# ConnectionPool, SchemaRegistry, RowMapper, ArtifactWriter and JobMetrics
+# are the same in Amcache_Scan.py and Cloudtopsy.py. Autopsy loads each
+# python_modules folder on its own, so one module can't import them from the
+# other; change both copies together.
+
+
+# One SQLite connection per database file, opened the first time it is
+# used and kept until the pool is closed, along with the prepared statements
+# run on it. Each job has its own pool, so a database is opened once per job
+# instead of once per lookup.
+class ConnectionPool(object):
+
+    def __init__(self):
+        self.connections = {}
+        self.statements = {}
+        self.lock = threading.RLock()
+
+    def connection(self, db_path):
+        with self.lock:
+            if db_path not in self.connections:
+                self.connections[db_path] = DriverManager.getConnection("jdbc:sqlite:%s" % db_path)
+            return self.connections[db_path]
+
+    # Return the statement for sql on db_path, prepared the first time it is asked for.
+    # The pool owns the statement, callers must not close it
+    def prepare(self, db_path, sql):
+        with self.lock:
+            if (db_path, sql) not in self.statements:
+                self.statements[(db_path, sql)] = self.connection(db_path).prepareStatement(sql)
+            return self.statements[(db_path, sql)]
+
+    # Close the statements and connection of one database, or of all of them
+    def close(self, db_path=None):
+        with self.lock:
+            for (path, sql) in self.statements.keys():
+                if db_path is None or path == db_path:
+                    self.statements.pop((path, sql)).close()
+            for path in self.connections.keys():
+                if db_path is None or path == db_path:
+                    self.connections.pop(path).close()
+
+
+# Keeps the artifact and attribute types of a case. The existing types are
+# loaded once per case and only the missing ones are created, so nothing is
+# added just to fail with "already exists" and the row loops never go back
+# to the case database for a type.
+class SchemaRegistry(object):
+
+    # The registry of the open case, shared by every job of that case
+    current = None
+    current_lock = threading.Lock()
+
+    @staticmethod
+    def for_case(skCase):
+        with SchemaRegistry.current_lock:
+            if SchemaRegistry.current is None or SchemaRegistry.current.skCase is not skCase:
+                SchemaRegistry.current = SchemaRegistry(skCase)
+            return SchemaRegistry.current
+
+    def __init__(self, skCase):
+        self.skCase = skCase
+        self.lock = threading.RLock()
+        self.artifact_types = {}
+        for artifact_type in skCase.getArtifactTypes():
+            self.artifact_types[artifact_type.getTypeName()] = artifact_type
+        self.attribute_types = {}
+        for attribute_type in skCase.getAttributeTypes():
+            self.attribute_types[attribute_type.getTypeName()] = attribute_type
+        self.row_mappers = {}
+
+    # Return the artifact type called name, creating it if needed
+    def artifact_type(self, name, display_name):
+        with self.lock:
+            if name not in self.artifact_types:
+                try:
+                    self.artifact_types[name] = self.skCase.addBlackboardArtifactType(name, display_name)
+                except (TskDataException, TskCoreException):
+                    # Another client of a multi-user case added it after the types were loaded
+                    self.artifact_types[name] = self.skCase.getArtifactType(name)
+            return self.artifact_types[name]
+
+    # Return the attribute type called name, creating it if needed
+    def attribute_type(self, name, value_type, display_name):
+        with self.lock:
+            if name not in self.attribute_types:
+                try:
+                    self.attribute_types[name] = self.skCase.addArtifactAttributeType(name, value_type, display_name)
+                except (TskDataException, TskCoreException):
+                    self.attribute_types[name] = self.skCase.getAttributeType(name)
+            return self.attribute_types[name]
+
+    # Return the TSK_<COLUMN> attribute type of each column of a table, in
+    # column order. TEXT columns are strings, DATETIME columns are dates and
+    # the others are longs
+    def column_types(self, column_names, column_types):
+        attribute_types = []
+        for col_name, col_type in zip(column_names, column_types):
+            if col_type.upper() in ("TEXT", ""):
+                value_type = BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING
+            elif col_type.upper() == "DATETIME":
+                value_type = BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.DATETIME
+            else:
+                value_type = BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.LONG
+            attribute_types.append(self.attribute_type("TSK_" + col_name.upper(), value_type, col_name))
+        return attribute_types
+
+    # Return the RowMapper for a table, built the first time the table is seen
+    def row_mapper(self, module_name, column_names, column_types):
+        with self.lock:
+            key = (module_name, tuple(column_names), tuple(column_types))
+            if key not in self.row_mappers:
+                self.row_mappers[key] = RowMapper(module_name, self.column_types(column_names, column_types))
+            return self.row_mappers[key]
+
+
+# Turns the rows of a table into blackboard attributes. The conversion of
+# each column is picked once from the value type of its attribute type, so
+# the row loop makes one call per cell and never looks at the column types.
+class RowMapper(object):
+
+    DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y", "%Y-%m-%d"]
+
+    def __init__(self, module_name, attribute_types):
+        self.module_name = module_name
+        self.columns = []
+        for attribute_type in attribute_types:
+            value_type = attribute_type.getValueType()
+            if value_type == BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING:
+                extract = RowMapper.text
+            elif value_type == BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.DATETIME:
+                extract = RowMapper.epoch
+            else:
+                extract = RowMapper.number
+            self.columns.append((attribute_type, extract))
+
+    # Return the attributes of a row, a list of values in column order.
+    # Missing values, and dates that can't be read, are left out
+    def attributes(self, row):
+        attributes = ArrayList()
+        for (attribute_type, extract), value in zip(self.columns, row):
+            value = extract(value)
+            if value is not None:
+                attributes.add(BlackboardAttribute(attribute_type, self.module_name, value))
+        return attributes
+
+    @staticmethod
+    def text(value):
+        if value is None or isinstance(value, unicode):
+            return value
+        return unicode(value)
+
+    # Numbers are always longs, so sizes and FILETIMEs keep all 64 bits.
+    # None if the value is missing or isn't a number, so the attribute is left out
+    @staticmethod
+    def number(value):
+        if value is None or value == "":
+            return None
+        try:
+            return long(value)
+        except (ValueError, TypeError):
+            return None
+
+    # Seconds since 1970 from a number of seconds or a UTC date and time
+    # like "2016-02-15 08:53:20.123456 UTC", "2016-02-15T08:53:20Z",
+    # "02/15/2016 08:53:20" or "02/15/2016", None if there isn't one
+    @staticmethod
+    def epoch(value):
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, long)):
+            return long(value)
+        text = value.strip()
+        if text.endswith(" UTC"):
+            text = text[:-4]
+        text = text.rstrip("Z").replace("T", " ").split(".")[0]
+        for date_format in RowMapper.DATE_FORMATS:
+            try:
+                return long(calendar.timegm(time.strptime(text, date_format)))
+            except ValueError:
+                continue
+        return None
+
+
+# Writes artifacts in batches. The attributes of a row are added in one call,
+# and the attributes of each batch of rows are committed in a single case
+# database transaction followed by one ModuleDataEvent per artifact type in
+# the batch, instead of one write per attribute. The artifacts themselves
+# are created just before the transaction is opened, so they don't compete
+# with it for the SQLite write lock, and are deleted again if the batch
+# fails, so a failed batch leaves nothing in the case.
+class ArtifactWriter(object):
+
+    def __init__(self, skCase, module_name, batch_size):
+        self.skCase = skCase
+        self.module_name = module_name
+        self.batch_size = batch_size
+        self.pending = []    # (file, artifact type, attributes) not committed yet
+        self.written = 0
+        self.attributes_written = 0
+        self.seconds = 0.0    # spent committing
+        # Called after each commit, if set
+        self.committed = None
+        # Called with the number of rows dropped when a commit fails, if set
+        self.failed = None
+
+    # Queue an artifact of artifact_type (a BlackboardArtifact.Type) on file
+    # for the next commit
+    def add(self, file, artifact_type, attributes):
+        self.pending.append((file, artifact_type, attributes))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    # Commit the queued rows and let the UI know about them
+    def flush(self):
+        if not self.pending:
+            return
+        started = time.time()
+        created = []
+        try:
+            for (file, artifact_type, attributes) in self.pending:
+                created.append((file.newArtifact(artifact_type.getTypeID()), artifact_type))
+            trans = self.skCase.beginTransaction()
+            try:
+                for index in range(len(created)):
+                    created[index][0].addAttributes(self.pending[index][2], trans)
+                trans.commit()
+            except TskCoreException:
+                trans.rollback()
+                raise
+        except TskCoreException:
+            for (art, artifact_type) in created:
+                try:
+                    self.skCase.deleteBlackboardArtifact(art)
+                except TskCoreException:
+                    pass
+            dropped = len(self.pending)
+            self.pending = []
+            if self.failed is not None:
+                self.failed(dropped)
+            raise
+        new_artifacts = {}
+        for (art, artifact_type) in created:
+            if artifact_type.getTypeID() not in new_artifacts:
+                new_artifacts[artifact_type.getTypeID()] = (artifact_type, ArrayList())
+            new_artifacts[artifact_type.getTypeID()][1].add(art)
+        for (artifact_type, artifacts) in new_artifacts.values():
+            IngestServices.getInstance().fireModuleDataEvent(ModuleDataEvent(self.module_name, artifact_type, artifacts))
+        self.written += len(self.pending)
+        self.attributes_written += sum([attributes.size() for (file, artifact_type, attributes) in self.pending])
+        self.seconds += time.time() - started
+        self.pending = []
+        if self.committed is not None:
+            self.committed()
+
+
+# Counts and times what an ingest job does, so runs can be compared across
+# versions and machines. Phase times add up over every thread working on the
+# phase, so together they can be more than the elapsed time of the job.
+# Histograms count durations in power-of-two millisecond buckets. Rates are
+# a counter per second of a phase, or of the whole job. Used from several
+# threads at once.
+class JobMetrics(object):
+
+    def __init__(self, module_name, module_version):
+        self.module_name = module_name
+        self.module_version = module_version
+        self.started = time.time()
+        self.finished = None
+        self.phases = {}        # phase -> seconds
+        self.counters = {}
+        self.histograms = {}    # histogram -> [count, seconds, max seconds, {bucket ms: count}]
+        self.rates = []         # (name, counter, phase or None for the whole job)
+        self.lock = threading.Lock()
+
+    def add_time(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def observe(self, histogram, seconds):
+        bucket = 1
+        while bucket < seconds * 1000:
+            bucket = bucket * 2
+        with self.lock:
+            entry = self.histograms.setdefault(histogram, [0, 0.0, 0.0, {}])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3][bucket] = entry[3].get(bucket, 0) + 1
+
+    def add_rate(self, name, counter, phase=None):
+        self.rates.append((name, counter, phase))
+
+    def finish(self):
+        self.finished = time.time()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def rate_values(self):
+        values = {}
+        for (name, counter, phase) in self.rates:
+            if phase is None:
+                seconds = self.elapsed()
+            else:
+                seconds = self.phases.get(phase, 0.0)
+            if seconds > 0:
+                values[name] = self.counters.get(counter, 0) / seconds
+        return values
+
+    # The metrics as one line each, for the details of an ingest message
+    def summary(self):
+        lines = ["Elapsed: %.1f s" % self.elapsed()]
+        for name in sorted(self.counters):
+            lines.append("%s: %d" % (name, self.counters[name]))
+        for (name, value) in sorted(self.rate_values().items()):
+            lines.append("%s: %.1f" % (name, value))
+        for phase in sorted(self.phases):
+            lines.append("%s: %.1f s" % (phase, self.phases[phase]))
+        for name in sorted(self.histograms):
+            count, seconds, max_seconds, buckets = self.histograms[name]
+            lines.append("%s: %d, mean %.0f ms, max %.0f ms" % (name, count, seconds * 1000 / count, max_seconds * 1000))
+        return "<br>".join(lines)
+
+    # Write the metrics to a JSON file, with the machine they were taken on
+    def save(self, path, data_source):
+        histograms = {}
+        for (name, (count, seconds, max_seconds, buckets)) in self.histograms.items():
+            histograms[name] = {"count": count, "seconds": seconds, "max_seconds": max_seconds,
+                                "buckets_ms": [[bucket, buckets[bucket]] for bucket in sorted(buckets)]}
+        metrics = {"module": self.module_name,
+                   "version": self.module_version,
+                   "data_source": data_source,
+                   "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+                   "elapsed_seconds": self.elapsed(),
+                   "processors": Runtime.getRuntime().availableProcessors(),
+                   "max_memory": Runtime.getRuntime().maxMemory(),
+                   "phase_seconds": self.phases,
+                   "counters": self.counters,
+                   "rates": self.rate_values(),
+                   "histograms": histograms}
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        metrics_file = open(path, "w")
+        try:
+            json.dump(metrics, metrics_file, indent=2, sort_keys=True)
+        finally:
+            metrics_file.close()
+
+
+# Looks up SHA1 hashes with the VirusTotal file report API. Several hashes are
+# sent in one request as a comma separated resource list, VirusTotal accepts
+# up to 4 of them per request for a public API key and 25 for a private one.
+class VirusTotalClient(object):
+
+    REPORT_URL = "https://www.virustotal.com/vtapi/v2/file/report"
+
+    def __init__(self, api_key, private):
+        self.api_key = api_key
+        if private:
+            self.batch_size = 25
+        else:
+            self.batch_size = 4
+
+    # Returns a dictionary of sha1 -> (positives, ratio, report link).
+    # Hashes VirusTotal has never seen come back as (-1, "Not Found", "").
+    # Hashes still queued for analysis (-2) or with an error report are
+    # left out, so they are neither cached nor reported and are looked up
+    # again next time
+    def lookup(self, sha1_list):
+        data = urllib.urlencode({'apikey': self.api_key, 'resource': ",".join(sha1_list)})
+        response = urllib2.urlopen(urllib2.Request(self.REPORT_URL, data), timeout=60)
+        try:
+            # VirusTotal answers 204 (no content) when the request quota is exceeded
+            if response.getcode() != 200:
+                raise IOError("VirusTotal returned HTTP " + str(response.getcode()))
+            reports = json.loads(response.read())
+        finally:
+            response.close()
+
+        # A single resource gets a single report back rather than a list
+        if isinstance(reports, dict):
+            reports = [reports]
+
+        results = {}
+        for report in reports:
+            sha1 = str(report.get('resource', '')).lower()
+            if report.get('response_code') == 1:
+                results[sha1] = (report['positives'], str(report['positives']) + "/" + str(report['total']), report['permalink'])
+            elif report.get('response_code') == 0:
+                results[sha1] = (-1, "Not Found", "")
+        return results
+
+
+# Persistent SHA1 -> VirusTotal result cache shared by every case. It is a
+# small SQLite database that lives next to GUI_Settings.db3 unless another
+# path is configured. Entries older than the TTL are ignored and purged, and
+# once the cache holds more than max_entries hashes the least recently used
+# ones are evicted when the cache is closed.
+class VirusTotalCache(object):
+
+    LOOKUP_CHUNK = 100
+
+    def __init__(self, connections, db_path, ttl_days, max_entries):
+        self.connections = connections
+        self.db_path = db_path
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.max_entries = max_entries
+        self.dbConn = None
+        # The parser and VirusTotal worker threads share the connection
+        self.lock = threading.RLock()
+
+    def open(self):
+        self.dbConn = self.connections.connection(self.db_path)
+        stmt = self.dbConn.createStatement()
+        stmt.executeUpdate("CREATE TABLE IF NOT EXISTS virustotal_cache (sha1 text PRIMARY KEY, vt_positives int, vt_ratio text, vt_report_link text, scanned_time int, last_used_time int);")
+        stmt.executeUpdate("DELETE FROM virustotal_cache WHERE scanned_time < " + str(long(time.time()) - self.ttl_seconds) + ";")
+        stmt.executeUpdate("CREATE TABLE IF NOT EXISTS virustotal_requests (day text PRIMARY KEY, requests int);")
+        stmt.close()
+
+    # Number of VirusTotal requests sent on a day, so the daily quota holds across jobs
+    def requests_on(self, day):
+        preparedStmt = self.connections.prepare(self.db_path, "SELECT requests FROM virustotal_requests WHERE day = ?;")
+        preparedStmt.setString(1, day)
+        resultSet = preparedStmt.executeQuery()
+        requests = 0
+        if resultSet.next():
+            requests = resultSet.getInt("requests")
+        return requests
+
+    def count_request(self, day):
+        with self.lock:
+            preparedStmt = self.connections.prepare(self.db_path, "INSERT OR IGNORE INTO virustotal_requests (day, requests) VALUES (?, 0);")
+            preparedStmt.setString(1, day)
+            preparedStmt.executeUpdate()
+            preparedStmt = self.connections.prepare(self.db_path, "UPDATE virustotal_requests SET requests = requests + 1 WHERE day = ?;")
+            preparedStmt.setString(1, day)
+            preparedStmt.executeUpdate()
+
+    # Returns a dictionary of sha1 -> (positives, ratio, report link) for the hashes that are cached
+    def get_many(self, sha1_list):
+        with self.lock:
+            results = {}
+            oldest = long(time.time()) - self.ttl_seconds
+            # Always LOOKUP_CHUNK hashes per query so one prepared statement serves
+            # every chunk, the last one is padded by repeating its last hash
+            preparedStmt = self.connections.prepare(self.db_path, "SELECT sha1, vt_positives, vt_ratio, vt_report_link FROM virustotal_cache WHERE scanned_time >= ? AND sha1 IN (" + ",".join(["?"] * self.LOOKUP_CHUNK) + ");")
+            for start in range(0, len(sha1_list), self.LOOKUP_CHUNK):
+                chunk = sha1_list[start:start + self.LOOKUP_CHUNK]
+                chunk = chunk + [chunk[-1]] * (self.LOOKUP_CHUNK - len(chunk))
+                preparedStmt.setLong(1, oldest)
+                for i in range(len(chunk)):
+                    preparedStmt.setString(i + 2, chunk[i])
+                resultSet = preparedStmt.executeQuery()
+                while resultSet.next():
+                    results[resultSet.getString("sha1")] = (resultSet.getInt("vt_positives"), resultSet.getString("vt_ratio"), resultSet.getString("vt_report_link"))
+                resultSet.close()
+            if results:
+                self.touch(results.keys())
+            return results
+
+    # Store a dictionary of VirusTotal results in one transaction
+    def put_many(self, results):
+        with self.lock:
+            now = long(time.time())
+            self.dbConn.setAutoCommit(False)
+            try:
+                preparedStmt = self.connections.prepare(self.db_path, "INSERT OR REPLACE INTO virustotal_cache (sha1, vt_positives, vt_ratio, vt_report_link, scanned_time, last_used_time) VALUES (?, ?, ?, ?, ?, ?);")
+                for sha1, (positives, ratio, report_link) in results.items():
+                    preparedStmt.setString(1, sha1)
+                    preparedStmt.setInt(2, positives)
+                    preparedStmt.setString(3, ratio)
+                    preparedStmt.setString(4, report_link)
+                    preparedStmt.setLong(5, now)
+                    preparedStmt.setLong(6, now)
+                    preparedStmt.addBatch()
+                preparedStmt.executeBatch()
+                self.dbConn.commit()
+            except SQLException:
+                self.dbConn.rollback()
+                raise
+            finally:
+                self.dbConn.setAutoCommit(True)
+
+    def touch(self, sha1_list):
+        now = long(time.time())
+        self.dbConn.setAutoCommit(False)
+        try:
+            preparedStmt = self.connections.prepare(self.db_path, "UPDATE virustotal_cache SET last_used_time = ? WHERE sha1 = ?;")
+            for sha1 in sha1_list:
+                preparedStmt.setLong(1, now)
+                preparedStmt.setString(2, sha1)
+                preparedStmt.addBatch()
+            preparedStmt.executeBatch()
+            self.dbConn.commit()
+        finally:
+            self.dbConn.setAutoCommit(True)
+
+    # Evict the least recently used hashes that don't fit and close the database
+    def close(self):
+        with self.lock:
+            if self.dbConn is None:
+                return
+            try:
+                stmt = self.dbConn.createStatement()
+                resultSet = stmt.executeQuery("SELECT COUNT(*) as count FROM virustotal_cache;")
+                extra = int(resultSet.getString("count")) - self.max_entries
+                if extra > 0:
+                    stmt.executeUpdate("DELETE FROM virustotal_cache WHERE sha1 IN (SELECT sha1 FROM virustotal_cache ORDER BY last_used_time LIMIT " + str(extra) + ");")
+                stmt.close()
+            finally:
+                self.connections.close(self.db_path)
+                self.dbConn = None
+
+
+# Persistent hive hash -> parsed tables cache shared by every case, so
+# byte-identical hives (VSS copies, re-acquired images) are only parsed once.
+# The tables are stored as compressed JSON, entries written by another
+# version of AmcacheParser are ignored and the least recently used hives are
+# evicted when the cache is closed.
+class ParseCache(object):
+
+    def __init__(self, connections, db_path, max_entries):
+        self.connections = connections
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.dbConn = None
+        # The parser threads share the connection
+        self.lock = threading.RLock()
+
+    def open(self):
+        self.dbConn = self.connections.connection(self.db_path)
+        stmt = self.dbConn.createStatement()
+        stmt.executeUpdate("CREATE TABLE IF NOT EXISTS parse_cache (hive_hash text PRIMARY KEY, parser_version int, tables text, last_used_time int);")
+        stmt.executeUpdate("DELETE FROM parse_cache WHERE parser_version <> " + str(AmcacheParser.VERSION) + ";")
+        stmt.close()
+
+    # Returns the tables parsed from the hive with this hash, or None
+    def get(self, hive_hash):
+        with self.lock:
+            preparedStmt = self.connections.prepare(self.db_path, "SELECT tables FROM parse_cache WHERE hive_hash = ?;")
+            preparedStmt.setString(1, hive_hash)
+            resultSet = preparedStmt.executeQuery()
+            data = None
+            if resultSet.next():
+                data = resultSet.getString("tables")
+            if data is None:
+                return None
+            preparedStmt = self.connections.prepare(self.db_path, "UPDATE parse_cache SET last_used_time = ? WHERE hive_hash = ?;")
+            preparedStmt.setLong(1, long(time.time()))
+            preparedStmt.setString(2, hive_hash)
+            preparedStmt.executeUpdate()
+        try:
+            return json.loads(zlib.decompress(base64.b64decode(data)))
+        except (ValueError, TypeError, zlib.error):
+            return None
+
+    def put(self, hive_hash, tables):
+        data = base64.b64encode(zlib.compress(json.dumps(tables)))
+        with self.lock:
+            preparedStmt = self.connections.prepare(self.db_path, "INSERT OR REPLACE INTO parse_cache (hive_hash, parser_version, tables, last_used_time) VALUES (?, ?, ?, ?);")
+            preparedStmt.setString(1, hive_hash)
+            preparedStmt.setInt(2, AmcacheParser.VERSION)
+            preparedStmt.setString(3, data)
+            preparedStmt.setLong(4, long(time.time()))
+            preparedStmt.executeUpdate()
+
+    # Evict the least recently used hives that don't fit and close the database
+    def close(self):
+        with self.lock:
+            if self.dbConn is None:
+                return
+            try:
+                stmt = self.dbConn.createStatement()
+                resultSet = stmt.executeQuery("SELECT COUNT(*) as count FROM parse_cache;")
+                extra = int(resultSet.getString("count")) - self.max_entries
+                if extra > 0:
+                    stmt.executeUpdate("DELETE FROM parse_cache WHERE hive_hash IN (SELECT hive_hash FROM parse_cache ORDER BY last_used_time LIMIT " + str(extra) + ");")
+                stmt.close()
+            finally:
+                self.connections.close(self.db_path)
+                self.dbConn = None
+
+
+# Token bucket that paces the VirusTotal requests. The bucket holds one
+# minute's worth of requests and refills continuously, so a public key gets a
+# burst of 4 requests and then one every 15 seconds. Requests are also
+# counted against a daily quota, a daily quota of 0 means there is none.
+# It is shared by the VirusTotal worker threads.
+class RateLimiter(object):
+
+    PUBLIC_PER_MINUTE = 4
+    PUBLIC_PER_DAY = 500
+
+    def __init__(self, per_minute, per_day, used_today):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_rate = per_minute / 60.0
+        self.last_refill = time.time()
+        self.per_day = per_day
+        self.used_today = used_today
+        self.day = RateLimiter.today()
+        self.exhausted_reported = False
+        self.lock = threading.Lock()
+
+    # VirusTotal quotas reset at midnight UTC
+    @staticmethod
+    def today():
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    # Seconds until the next request may be sent, 0 if it may be sent right now
+    def wait_time(self):
+        with self.lock:
+            return self._wait_time()
+
+    def _wait_time(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.refill_rate
+
+    # True once the daily quota has been used up
+    def exhausted(self):
+        with self.lock:
+            return self._exhausted()
+
+    def _exhausted(self):
+        if self.day != RateLimiter.today():
+            self.day = RateLimiter.today()
+            self.used_today = 0
+            self.exhausted_reported = False
+        return self.per_day > 0 and self.used_today >= self.per_day
+
+    # True the first time it is called after the daily quota ran out, so it is only reported once
+    def report_exhausted(self):
+        with self.lock:
+            if self.exhausted_reported:
+                return False
+            self.exhausted_reported = True
+            return True
+
+    # Wait for a token for a request that is about to be sent. Only the calling
+    # worker thread waits. Returns False without a token if the daily quota is
+    # used up or should_stop() returns True
+    def acquire(self, should_stop):
+        while True:
+            with self.lock:
+                if self._exhausted():
+                    return False
+                wait = self._wait_time()
+                if wait == 0:
+                    self.tokens -= 1
+                    self.used_today += 1
+                    return True
+            if should_stop():
+                return False
+            # Sleep in short steps so a cancel is noticed quickly
+            time.sleep(min(wait, 1.0))
+
+
+# Reads an AbstractFile a page at a time, only when a cell on that page is
+# needed. Pages are kept once read, so a hive is never read twice and only
+# the parts reachable from the parsed keys are read at all.
+class HivePageReader(object):
+
+    PAGE_SIZE = 0x1000
+
+    def __init__(self, file):
+        self.file = file
+        self.file_size = file.getSize()
+        self.size = self.file_size
+        self.pages = {}
+
+    # Returns length bytes from offset. Raises ValueError if the range is
+    # outside the hive (a corrupt offset), IOError if the file can't be read
+    # or comes up short
+    def read(self, offset, length):
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError("Read past the end of the hive at offset " + hex(offset))
+        first_page = offset // self.PAGE_SIZE
+        last_page = (offset + length - 1) // self.PAGE_SIZE
+        if first_page == last_page or length == 0:
+            page_offset = offset - first_page * self.PAGE_SIZE
+            return self.page(first_page)[page_offset:page_offset + length]
+        data = "".join([self.page(number) for number in range(first_page, last_page + 1)])
+        page_offset = offset - first_page * self.PAGE_SIZE
+        return data[page_offset:page_offset + length]
+
+    def page(self, number):
+        if number not in self.pages:
+            offset = number * self.PAGE_SIZE
+            length = max(0, min(self.PAGE_SIZE, self.file_size - offset))
+            data = ""
+            if length > 0:
+                buffer = jarray.zeros(length, "b")
+                try:
+                    count = self.file.read(buffer, offset, length)
+                except TskCoreException as e:
+                    raise IOError("Error reading " + self.file.getName() + " (" + e.getMessage() + ")")
+                if count != length:
+                    raise IOError("Short read from " + self.file.getName() + " at offset " + hex(offset))
+                data = buffer.tostring()
+            # Pages a transaction log added past the end of the file start out empty
+            self.pages[number] = data + "\x00" * (min(self.PAGE_SIZE, self.size - offset) - length)
+        return self.pages[number]
+
+    # Lay data over the hive from offset on, growing it if needed. The file
+    # itself is never changed, only the pages kept in memory
+    def patch(self, offset, data):
+        end = offset + len(data)
+        if end > self.size:
+            self.size = end
+        position = offset
+        while position < end:
+            number = position // self.PAGE_SIZE
+            page_offset = position - number * self.PAGE_SIZE
+            length = min(self.PAGE_SIZE - page_offset, end - position)
+            page = self.page(number).ljust(self.PAGE_SIZE, "\x00")
+            chunk = data[position - offset:position - offset + length]
+            self.pages[number] = page[:page_offset] + chunk + page[page_offset + length:]
+            position += length
+
+
+# Replays the dirty pages of a hive's transaction logs (.LOG1/.LOG2) over
+# the pages read from the hive, so a dirty hive parses the way Windows
+# would see it once the logs were flushed. Handles the HvLE logs of
+# Windows 8.1 and later and the older DIRT logs.
+class TransactionLogReplay(object):
+
+    BASE_BLOCK_SIZE = 0x200
+    SECTOR_SIZE = 0x200
+    HVLE_HEADER_SIZE = 40
+
+    # reader is the HivePageReader of the hive
+    def __init__(self, reader):
+        self.reader = reader
+
+    # logs are HivePageReaders of the transaction logs.
+    # Returns the number of dirty pages (or sectors, for DIRT logs) applied
+    def apply(self, logs):
+        header = self.reader.read(0, 0x30)
+        primary_sequence, secondary_sequence = struct.unpack_from("<II", header, 4)
+
+        entries = {}
+        dirt_logs = []
+        for log in logs:
+            if log.size < self.BASE_BLOCK_SIZE + 4 or log.read(0, 4) != "regf":
+                continue
+            signature = log.read(self.BASE_BLOCK_SIZE, 4)
+            if signature == "HvLE":
+                for (sequence, offset) in self.log_entries(log):
+                    entries.setdefault(sequence, (log, offset))
+            elif signature == "DIRT":
+                dirt_logs.append(log)
+
+        # Log entries carry on from the last sequence number written to the
+        # hive. Anything that doesn't follow on is left over from an older
+        # cycle of the log, or was never completely written.
+        applied = 0
+        sequence = secondary_sequence
+        while sequence in entries:
+            log, offset = entries[sequence]
+            applied += self.apply_entry(log, offset)
+            sequence += 1
+
+        # A DIRT log only holds anything the hive lacks while the hive is
+        # marked as being written (primary and secondary sequence differ)
+        if applied == 0 and primary_sequence != secondary_sequence:
+            for log in dirt_logs:
+                log_primary, log_secondary = struct.unpack_from("<II", log.read(0, 0x30), 4)
+                if log_primary == log_secondary and log_primary >= secondary_sequence:
+                    applied += self.apply_dirt(log)
+                    break
+        return applied
+
+    # Yield (sequence number, offset) of each HvLE entry in a log
+    def log_entries(self, log):
+        offset = self.BASE_BLOCK_SIZE
+        while offset + self.HVLE_HEADER_SIZE <= log.size:
+            header = log.read(offset, self.HVLE_HEADER_SIZE)
+            if header[0:4] != "HvLE":
+                return
+            size, flags, sequence, hive_bins_size, page_count = struct.unpack_from("<IIIII", header, 4)
+            if size < self.HVLE_HEADER_SIZE + page_count * 8 or size % self.SECTOR_SIZE or offset + size > log.size:
+                return
+            yield (sequence, offset)
+            offset += size
+
+    def apply_entry(self, log, offset):
+        header = log.read(offset, self.HVLE_HEADER_SIZE)
+        size, flags, sequence, hive_bins_size, page_count = struct.unpack_from("<IIIII", header, 4)
+        references = log.read(offset + self.HVLE_HEADER_SIZE, page_count * 8)
+
+        # Check every page fits before laying any of them over the hive
+        pages = []
+        data_offset = offset + self.HVLE_HEADER_SIZE + page_count * 8
+        for i in range(page_count):
+            page_offset, page_size = struct.unpack_from("<II", references, i * 8)
+            if data_offset + page_size > offset + size or page_offset + page_size > hive_bins_size:
+                raise ValueError("Invalid dirty page in transaction log entry " + str(sequence))
+            pages.append((page_offset, data_offset, page_size))
+            data_offset += page_size
+
+        for (page_offset, data_offset, page_size) in pages:
+            self.reader.patch(RegistryHive.HBIN_START + page_offset, log.read(data_offset, page_size))
+        return page_count
+
+    # A DIRT log has a bitmap with one bit per 512 byte sector of the hive
+    # bins, followed by the dirty sectors in order
+    def apply_dirt(self, log):
+        hive_bins_size, = struct.unpack_from("<I", log.read(0, 0x30), 0x28)
+        bitmap_size = hive_bins_size // (self.SECTOR_SIZE * 8)
+        bitmap = log.read(self.BASE_BLOCK_SIZE + 4, bitmap_size)
+        data_offset = self.BASE_BLOCK_SIZE + 4 + bitmap_size
+        data_offset = (data_offset + self.SECTOR_SIZE - 1) // self.SECTOR_SIZE * self.SECTOR_SIZE
+
+        sectors = 0
+        for bit in range(bitmap_size * 8):
+            if ord(bitmap[bit // 8]) >> (bit % 8) & 1:
+                self.reader.patch(RegistryHive.HBIN_START + bit * self.SECTOR_SIZE, log.read(data_offset, self.SECTOR_SIZE))
+                data_offset += self.SECTOR_SIZE
+                sectors += 1
+        return sectors
+
+
+# Reads the keys and values of a registry hive (regf format). Only what is
+# needed to walk Amcache.hve is supported: nk/vk cells, lf/lh/li/ri subkey
+# lists and big data (db) values. Offsets are relative to the first hbin.
+class RegistryHive(object):
+
+    HBIN_START = 0x1000
+
+    REG_SZ = 1
+    REG_EXPAND_SZ = 2
+    REG_DWORD = 4
+    REG_DWORD_BIG_ENDIAN = 5
+    REG_MULTI_SZ = 7
+    REG_QWORD = 11
+
+    # reader reads the hive, see HivePageReader. Raises ValueError if it isn't a hive
+    def __init__(self, reader):
+        self.reader = reader
+        header = self.reader.read(0, 0x30)
+        if header[0:4] != "regf":
+            raise ValueError("Not a registry hive")
+        self.minor_version = struct.unpack_from("<I", header, 0x18)[0]
+        self.root_offset = struct.unpack_from("<I", header, 0x24)[0]
+
+    # The content of the cell at offset, without its size
+    def cell(self, offset):
+        size = abs(struct.unpack("<i", self.reader.read(self.HBIN_START + offset, 4))[0])
+        if size < 4:
+            raise ValueError("Invalid cell at offset " + hex(offset))
+        return self.reader.read(self.HBIN_START + offset + 4, size - 4)
+
+    def root(self):
+        return RegistryKey(self, self.root_offset)
+
+    # Open a key by its path below the root key. In Amcache.hve the root key is
+    # a {GUID} key and Root is a subkey of it, so Root\InventoryApplicationFile
+    # is looked up as <root key>\Root\InventoryApplicationFile.
+    # Returns None if it doesn't exist
+    def open(self, path):
+        key = self.root()
+        for name in path.split("\\"):
+            key = key.subkey(name)
+            if key is None:
+                return None
+        return key
+
+
+class RegistryKey(object):
+
+    def __init__(self, hive, offset):
+        self.hive = hive
+        cell = hive.cell(offset)
+        if cell[0:2] != "nk":
+            raise ValueError("Invalid key at offset " + hex(offset))
+        flags, self.last_written = struct.unpack_from("<HQ", cell, 2)
+        self.subkey_count, = struct.unpack_from("<I", cell, 0x14)
+        self.subkey_list, = struct.unpack_from("<I", cell, 0x1c)
+        self.value_count, self.value_list = struct.unpack_from("<II", cell, 0x24)
+        name_length, = struct.unpack_from("<H", cell, 0x48)
+        name = cell[0x4c:0x4c + name_length]
+        # Compressed names are ASCII, the others UTF-16
+        if flags & 0x20:
+            self.name = name.decode("latin-1")
+        else:
+            self.name = name.decode("utf-16-le")
+
+    # Last written time as a FILETIME
+    def timestamp(self):
+        return self.last_written
+
+    def subkeys(self):
+        if self.subkey_count == 0:
+            return []
+        return [RegistryKey(self.hive, offset) for offset in self.subkey_offsets(self.subkey_list)]
+
+    def subkey_offsets(self, list_offset):
+        cell = self.hive.cell(list_offset)
+        signature = cell[0:2]
+        count, = struct.unpack_from("<H", cell, 2)
+        if signature in ("lf", "lh"):
+            return [struct.unpack_from("<I", cell, 4 + i * 8)[0] for i in range(count)]
+        if signature == "li":
+            return list(struct.unpack_from("<" + str(count) + "I", cell, 4))
+        if signature == "ri":
+            offsets = []
+            for sublist in struct.unpack_from("<" + str(count) + "I", cell, 4):
+                offsets.extend(self.subkey_offsets(sublist))
+            return offsets
+        raise ValueError("Invalid subkey list at offset " + hex(list_offset))
+
+    # Returns the subkey called name (case insensitive), or None
+    def subkey(self, name):
+        for key in self.subkeys():
+            if key.name.lower() == name.lower():
+                return key
+        return None
+
+    # Returns a dictionary of value name -> value
+    def values(self):
+        values = {}
+        if self.value_count == 0:
+            return values
+        cell = self.hive.cell(self.value_list)
+        for offset in struct.unpack_from("<" + str(self.value_count) + "I", cell, 0):
+            name, value = self.read_value(offset)
+            values[name] = value
+        return values
+
+    def read_value(self, offset):
+        cell = self.hive.cell(offset)
+        if cell[0:2] != "vk":
+            raise ValueError("Invalid value at offset " + hex(offset))
+        name_length, data_size, data_offset, data_type, flags = struct.unpack_from("<HIIIH", cell, 2)
+        name = cell[0x14:0x14 + name_length]
+        if flags & 0x1:
+            name = name.decode("latin-1")
+        else:
+            name = name.decode("utf-16-le")
+
+        # Small values are stored in the data offset field itself
+        if data_size & 0x80000000:
+            data_size = data_size & 0x7fffffff
+            data = cell[8:8 + data_size]
+        elif data_size > 16344 and self.hive.minor_version > 3:
+            data = self.read_big_data(data_offset, data_size)
+        else:
+            data = self.hive.cell(data_offset)[:data_size]
+        return (name, self.convert(data_type, data))
+
+    # Values over 16344 bytes are split over several cells listed by a db cell
+    def read_big_data(self, offset, data_size):
+        cell = self.hive.cell(offset)
+        count, list_offset = struct.unpack_from("<HI", cell, 2)
+        segments = struct.unpack_from("<" + str(count) + "I", self.hive.cell(list_offset), 0)
+        return "".join([self.hive.cell(segment)[:16344] for segment in segments])[:data_size]
+
+    def convert(self, data_type, data):
+        if data_type in (RegistryHive.REG_SZ, RegistryHive.REG_EXPAND_SZ):
+            return data.decode("utf-16-le", "replace").split(u"\x00")[0]
+        if data_type == RegistryHive.REG_MULTI_SZ:
+            return data.decode("utf-16-le", "replace").rstrip(u"\x00").split(u"\x00")
+        if data_type == RegistryHive.REG_DWORD and len(data) >= 4:
+            return struct.unpack_from("<I", data)[0]
+        if data_type == RegistryHive.REG_DWORD_BIG_ENDIAN and len(data) >= 4:
+            return struct.unpack_from(">I", data)[0]
+        if data_type == RegistryHive.REG_QWORD and len(data) >= 8:
+            return struct.unpack_from("<Q", data)[0]
+        return data
+
+
+# Turns the keys of an Amcache.hve into rows, one table per key type. The
+# tables, columns and conversions are the ones amcache2sqlite.exe used to
+# write to its SQLite database, so the artifacts keep the same names.
+class AmcacheParser(object):
+
+    # Bump when the rows change, so parse cache entries of older versions are dropped
+    VERSION = 2
+
+    # Text columns that hold a date and time without a conversion to say so
+    TIMESTAMP_COLUMNS = ['source_key_timestamp', 'link_date', 'driver_ver_date', 'date']
+
+    # (table, key path, levels of subkeys below it, [(column, type, value name, conversion)])
+    TABLES = [
+        ('root_file', 'root\\File', 2, [
+            ('registry_key', 'text', None, None), ('source_key_timestamp', 'text', None, None),
+            ('path_file', 'text', '15', None), ('modified_timestamp', 'text', '17', 'filetime'),
+            ('program_id', 'text', '100', None), ('sha1', 'text', '101', None),
+            ('linker_timestamp', 'text', 'f', 'unixtime'), ('modified_timestamp2', 'text', '11', 'filetime'),
+            ('created_timestamp', 'text', '12', 'filetime'), ('product', 'text', '0', None),
+            ('company', 'text', '1', None), ('file_version', 'text', '2', None),
+            ('size', 'integer', '6', None), ('pe_sizeofimage', 'integer', '7', None),
+            ('pe_hash', 'text', '8', None), ('pe_checksum', 'text', '9', None),
+            ('file_description', 'text', 'c', None)]),
+        ('root_programs', 'root\\Programs', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('program_name', 'text', '0', None), ('install_date', 'text', 'a', 'unixtime'),
+            ('program_version', 'text', '1', None), ('publisher', 'text', '2', None),
+            ('entry_type', 'text', '6', None), ('product_code', 'text', 'f', None),
+            ('product_guid', 'text', '10', None), ('msi_product_code', 'text', '11', 'multi'),
+            ('msi_package_code', 'text', '12', 'multi'), ('reg_uninstall_key', 'text', '7', 'multi'),
+            ('list_of_file_paths', 'text', 'd', 'multi'), ('list_of_files_in_package', 'text', 'Files', 'multi')]),
+        ('inventory_application_file', 'Root\\InventoryApplicationFile', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('program_id', 'text', 'ProgramId', None), ('sha1', 'text', 'FileId', None),
+            ('lower_case_long_path', 'text', 'LowerCaseLongPath', None), ('name', 'text', 'Name', None),
+            ('publisher', 'text', 'Publisher', None), ('version', 'text', 'Version', None),
+            ('long_path_hash', 'text', 'LongPathHash', None), ('binfile_version', 'text', 'BinFileVersion', None),
+            ('product_name', 'text', 'ProductName', None), ('product_version', 'text', 'ProductVersion', None),
+            ('link_date', 'text', 'LinkDate', None), ('size', 'int', 'Size', None),
+            ('binary_type', 'text', 'BinaryType', None), ('is_pe_file', 'int', 'IsPeFile', None),
+            ('is_os_component', 'int', 'IsOsComponent', None), ('bin_product_version', 'text', 'BinProductVersion', None),
+            ('language', 'text', 'Language', None), ('usn', 'int', 'Usn', None)]),
+        ('inventory_device_container', 'Root\\InventoryDeviceContainer', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('model_name', 'text', 'ModelName', None), ('icon', 'text', 'Icon', None),
+            ('friendly_name', 'text', 'FriendlyName', None), ('categories', 'text', 'Categories', None),
+            ('is_connected', 'int', 'IsConnected', None), ('is_active', 'int', 'IsActive', None),
+            ('is_paired', 'int', 'IsPaired', None), ('is_networked', 'int', 'IsNetworked', None),
+            ('state', 'int', 'State', None), ('model_id', 'text', 'ModelId', None),
+            ('model_number', 'text', 'ModelNumber', None), ('manufacturer', 'text', 'Manufacturer', None),
+            ('primary_category', 'text', 'PrimaryCategory', None), ('is_machine_container', 'int', 'IsMachineContainer', None),
+            ('discovery_method', 'text', 'DiscoveryMethod', None)]),
+        ('inventory_device_pnp', 'Root\\InventoryDevicePnp', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('model', 'text', 'Model', None), ('manufacturer', 'text', 'Manufacturer', None),
+            ('provider', 'text', 'Provider', None), ('driver_name', 'text', 'DriverName', None),
+            ('parent_id', 'text', 'ParentId', None), ('class', 'text', 'Class', None),
+            ('class_guid', 'text', 'ClassGuid', None), ('description', 'text', 'Description', None),
+            ('install_state', 'text', 'InstallState', None), ('driver_ver_date', 'text', 'DriverVerDate', None),
+            ('driver_ver_version', 'text', 'DriverVerVersion', None), ('enumerator', 'text', 'Enumerator', None),
+            ('service', 'text', 'Service', None), ('container_id', 'text', 'ContainerId', None),
+            ('driver_id', 'text', 'DriverId', None), ('stack_id', 'text', 'STACKID', None),
+            ('driver_package_strong_name', 'text', 'DriverPackageStrongName', None), ('matching_id', 'text', 'MatchingID', None),
+            ('hwid', 'text', 'HWID', None), ('inf', 'text', 'Inf', None),
+            ('problem_code', 'text', 'ProblemCode', None), ('compid', 'text', 'COMPID', None),
+            ('device_state', 'text', 'DeviceState', None), ('bus_reported_description', 'text', 'BusReportedDescription', None),
+            ('upper_class_filters', 'text', 'UpperClassFilters', None), ('lower_class_filters', 'text', 'LowerClassFilters', None),
+            ('upper_filters', 'text', 'UpperFilters', None), ('lower_filters', 'text', 'LowerFilters', None)]),
+        ('inventory_driver_binary', 'Root\\InventoryDriverBinary', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('driver_timestamp', 'text', 'DriverTimeStamp', 'unixtime'), ('driver_last_modified', 'text', 'DriverLastWriteTime', 'unixtime'),
+            ('driver_name', 'text', 'DriverName', None), ('driver_signed', 'int', 'DriverSigned', None),
+            ('driver_checksum', 'int', 'DriverCheckSum', None), ('driver_company', 'text', 'DriverCompany', None),
+            ('driver_id', 'text', 'DriverId', None), ('driver_package_strong_name', 'text', 'DriverPackageStrongName', None),
+            ('driver_type', 'int', 'DriverType', None), ('driver_version', 'text', 'DriverVersion', None),
+            ('image_size', 'int', 'ImageSize', None), ('inf', 'text', 'Inf', None),
+            ('product', 'text', 'Product', None), ('product_version', 'text', 'ProductVersion', None),
+            ('service', 'text', 'Service', None), ('wdfversion', 'text', 'WdfVersion', None),
+            ('driver_in_box', 'int', 'DriverInBox', None), ('driver_is_kernel_mode', 'int', 'DriverIsKernelMode', None)]),
+        ('inventory_driver_package', 'Root\\InventoryDriverPackage', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('date', 'text', 'Date', None), ('class', 'text', 'Class', None),
+            ('directory', 'text', 'Directory', None), ('hwids', 'text', 'Hwids', None),
+            ('inf', 'text', 'Inf', None), ('provider', 'text', 'Provider', None),
+            ('submission_id', 'int', 'SubmissionId', None), ('sysfile', 'text', 'SYSFILE', None),
+            ('version', 'text', 'Version', None), ('class_guid', 'text', 'ClassGuid', None),
+            ('driver_in_box', 'int', 'DriverInBox', None)]),
+        ('inventory_application_shortcut', 'Root\\InventoryApplicationShortcut', 1, [
+            ('source_key_timestamp', 'text', None, None), ('registry_key', 'text', None, None),
+            ('shortcut_path', 'text', 'ShortcutPath', None)]),
+    ]
+
+    # Returns {table name: (column names, column types, rows)} for the tables
+    # that have at least one key. Column names are upper case like the
+    # PRAGMA table_info pass used to return them, and each row is a list of
+    # values in column order, starting with the p_key row number.
+    def parse(self, hive):
+        tables = {}
+        for (table_name, key_path, levels, columns) in self.TABLES:
+            parent = hive.open(key_path)
+            if parent is None:
+                continue
+            rows = []
+            for (path, key) in self.walk(parent, key_path, levels):
+                rows.append(self.make_row(len(rows) + 1, path, key, columns))
+            if rows:
+                Column_Names = ["P_KEY"] + [column[0].upper() for column in columns]
+                Column_Types = ["INTEGER"] + [self.column_type(column) for column in columns]
+                tables[table_name] = (Column_Names, Column_Types, rows)
+        return tables
+
+    # The column type artifacts are made with. Timestamps are DATETIME, so
+    # they work with the timeline and date filters, the row keeps their text
+    def column_type(self, column):
+        (column_name, column_type, value_name, conversion) = column
+        if conversion in ('filetime', 'unixtime') or column_name in self.TIMESTAMP_COLUMNS:
+            return "DATETIME"
+        return column_type.upper()
+
+    # Yield (key path, key) for the keys levels below key
+    def walk(self, key, path, levels):
+        for subkey in key.subkeys():
+            subkey_path = path + "\\" + subkey.name
+            if levels == 1:
+                yield (subkey_path, subkey)
+            else:
+                for item in self.walk(subkey, subkey_path, levels - 1):
+                    yield item
+
+    def make_row(self, p_key, path, key, columns):
+        values = key.values()
+        row = [p_key]
+        for (column, column_type, value_name, conversion) in columns:
+            if column == 'registry_key':
+                row.append(path)
+            elif column == 'source_key_timestamp':
+                row.append(self.filetime(key.timestamp()))
+            else:
+                row.append(self.convert(values.get(value_name), column_type, conversion))
+        return row
+
+    def convert(self, value, column_type, conversion):
+        if value is None or value == "" or value == []:
+            return None
+        if conversion == 'filetime' and isinstance(value, (int, long)):
+            value = self.filetime(value)
+            if value is None:
+                return None
+        elif conversion == 'unixtime' and isinstance(value, (int, long)):
+            value = time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(value))
+        elif conversion == 'unixtime':
+            value = value + ' UTC'
+        if isinstance(value, list):
+            value = ", ".join([item for item in value if item])
+        if column_type == 'text':
+            if isinstance(value, str) and conversion is None:
+                # REG_BINARY data
+                return value.encode("hex")
+            return unicode(value)
+        try:
+            if isinstance(value, basestring) and value.lower().startswith("0x"):
+                return long(value, 16)
+            return long(value)
+        except ValueError:
+            return None
+
+    # FILETIME to text, the way python-registry and amcache2sqlite.exe printed it.
+    # None if it is past what a datetime can hold
+    @staticmethod
+    def filetime(value):
+        try:
+            return str(datetime.datetime(1601, 1, 1) + datetime.timedelta(microseconds=value / 10)) + " UTC"
+        except OverflowError:
+            return None
 
 
 # Factory that defines the name and details of the module and allows Autopsy
@@ -94,6 +1264,7 @@ class AmcacheScanIngestModuleFactory(IngestModuleFactoryAdapter):
         self.settings = None
 
     moduleName = "Amcache Scan"
+    moduleVersion = "1.0"
     
     def getModuleDisplayName(self):
         return self.moduleName
@@ -102,7 +1273,7 @@ class AmcacheScanIngestModuleFactory(IngestModuleFactoryAdapter):
         return "Send Amcache SHA1 hashes to VirusTotal"
     
     def getModuleVersionNumber(self):
-        return "1.0"
+        return self.moduleVersion
     
     def getDefaultIngestJobSettings(self):
         return AmcacheScanWithUISettings()
@@ -128,7 +1299,21 @@ class AmcacheScanIngestModule(DataSourceIngestModule):
     _logger = Logger.getLogger(AmcacheScanIngestModuleFactory.moduleName)
 
     def log(self, level, msg):
-        self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
+        self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name, msg)
+
+    # Worker threads looking up hashes with a private key, a public key only gets one
+    VIRUSTOTAL_WORKERS = 4
+    # Most hives (live, RegBack, VSS, Windows.old) parsed at the same time,
+    # never more than there are processors
+    PARSER_THREADS = 8
+    # Parsed hives kept in the parse cache
+    PARSE_CACHE_ENTRIES = 50
+    # Bytes read at a time when a hive's MD5 has to be computed
+    HASH_BUFFER_SIZE = 1024 * 1024
+    # Hashes the parser thread may queue ahead of the VirusTotal workers
+    HASH_QUEUE_SIZE = 1000
+    # Artifacts committed to the case database per transaction
+    ARTIFACT_BATCH_SIZE = 1000
 
     def __init__(self, settings):
         self.context = None
@@ -143,20 +1328,24 @@ class AmcacheScanIngestModule(DataSourceIngestModule):
         self.context = context
         self.API_Key = self.local_settings.getAPI_Key()
         self.Private = self.local_settings.getPrivate()
-        self.root_file_exists = 0
-        self.root_file_count = 0
-        self.inventory_application_file_exists = 0
-        self.inventory_application_file_count = 0
+        self.Cache_Path = self.local_settings.getCache_Path()
+        if not self.Cache_Path:
+            self.Cache_Path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "VirusTotal_Cache.db3")
+        self.Cache_TTL = self.local_settings.getCache_TTL()
+        self.Cache_Max_Entries = self.local_settings.getCache_Max_Entries()
+        self.Private_Quota = self.local_settings.getPrivate_Quota()
+        self.Differential = self.local_settings.getDifferential()
         self.count = 0
         self.sum = 0
 
         #Record Parameters
         self.log(Level.INFO, "API_Key: " + str(self.API_Key))
         self.log(Level.INFO, "Private: " + str(self.Private))
-
-        self.my_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), "amcache2sqlite.exe")
-        if not os.path.exists(self.my_exe):
-            raise IngestModuleException("EXE was not found in module folder")
+        self.log(Level.INFO, "Cache_Path: " + str(self.Cache_Path))
+        self.log(Level.INFO, "Cache_TTL: " + str(self.Cache_TTL))
+        self.log(Level.INFO, "Cache_Max_Entries: " + str(self.Cache_Max_Entries))
+        self.log(Level.INFO, "Private_Quota: " + str(self.Private_Quota))
+        self.log(Level.INFO, "Differential: " + str(self.Differential))
 
        #create my tables
         self.List_Of_tables.append('root_file')
@@ -171,6 +1360,14 @@ class AmcacheScanIngestModule(DataSourceIngestModule):
         self.List_Of_tables.append('root_file_virustotal_scan')
         self.List_Of_tables.append('inventory_application_file_virustotal_scan')
 
+        # Tables whose SHA1 hashes are sent to VirusTotal, and the column holding the file path
+        self.List_Of_Scan_Tables = [('root_file', 'path_file'), ('inventory_application_file', 'lower_case_long_path')]
+        self.Scan_Column_Names = ["p_key","file","sha1","vt_positives","vt_ratio","vt_report_link"]
+        self.Scan_Column_Types = ["int","text","text","int","text","text"]
+        # Added to the registry key tables in differential mode
+        self.Diff_Column_Names = ["FIRST_SEEN_HIVE", "LAST_SEEN_HIVE", "SEEN_IN_HIVES", "CHANGE"]
+        self.Diff_Column_Types = ["TEXT", "TEXT", "INTEGER", "TEXT"]
+
     # Where the analysis is done.
     # The 'dataSource' object being passed in is of type org.sleuthkit.datamodel.Content.
     # See:x http://www.sleuthkit.org/sleuthkit/docs/jni-docs/interfaceorg_1_1sleuthkit_1_1datamodel_1_1_content.html
@@ -183,357 +1380,626 @@ class AmcacheScanIngestModule(DataSourceIngestModule):
             IngestServices.getInstance().postMessage(message)
             return IngestModule.ProcessResult.ERROR
 
-        # Check if this is Windows
-        if not PlatformUtil.isWindowsOS(): 
-            self.log(Level.INFO, "Ignoring data source.  Not running on Windows")
-            return IngestModule.ProcessResult.OK
-
         # we don't know how much work there is yet
         progressBar.switchToIndeterminate()
 
         skCase = Case.getCurrentCase().getSleuthkitCase();
+        self.schema = SchemaRegistry.for_case(skCase)
+        self.artifacts = ArtifactWriter(skCase, AmcacheScanIngestModuleFactory.moduleName, self.ARTIFACT_BATCH_SIZE)
+        self.metrics = JobMetrics(AmcacheScanIngestModuleFactory.moduleName, AmcacheScanIngestModuleFactory.moduleVersion)
+        self.artifacts.failed = self.discard_batch
+        self.metrics.add_rate("artifacts_per_second", "artifacts")
+        self.metrics.add_rate("attributes_per_second", "attributes")
+        self.metrics.add_rate("artifacts_per_write_second", "artifacts", "write")
+        self.metrics.add_rate("rows_read_per_parse_second", "rows_read", "parse")
         fileManager = Case.getCurrentCase().getServices().getFileManager()
         files = fileManager.findFiles(dataSource, "Amcache.hve")
         numFiles = len(files)
         self.log(Level.INFO, "found " + str(numFiles) + " files")
-        fileCount = 0;
+        hives = self.find_transaction_logs(fileManager, dataSource, files)
+        self.metrics.count("hives", len(hives))
 
-        Temp_Dir = Case.getCurrentCase().getTempDirectory()
-        self.log(Level.INFO, "Found temporary directory: " + Temp_Dir)
+        client = VirusTotalClient(self.API_Key, self.Private)
+        self.connections = ConnectionPool()
+        self.cache = VirusTotalCache(self.connections, self.Cache_Path, self.Cache_TTL, self.Cache_Max_Entries)
+        try:
+            self.cache.open()
+            if self.Private:
+                limiter = RateLimiter(self.Private_Quota, 0, 0)
+            else:
+                limiter = RateLimiter(RateLimiter.PUBLIC_PER_MINUTE, RateLimiter.PUBLIC_PER_DAY, self.cache.requests_on(RateLimiter.today()))
+        except SQLException as e:
+            self.log(Level.INFO, "Could not open VirusTotal cache " + self.Cache_Path + " (" + e.getMessage() + ")")
+            message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " Could not open VirusTotal cache " )
+            IngestServices.getInstance().postMessage(message)
+            self.connections.close()
+            return IngestModule.ProcessResult.ERROR
 
         message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " Parsing Amcache.Hve " ) 
         IngestServices.getInstance().postMessage(message) 
-        # Dump Amcache.hve files in the temp directory
-        for file in files:
-
-            # Check if the user pressed cancel while we were busy
-            if self.context.isJobCancelled():
-                return IngestModule.ProcessResult.OK
-
-            self.log(Level.INFO, "Processing file: " + file.getName())
-            fileCount += 1
+        message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " Beginning VirusTotal Scan " ) 
+        IngestServices.getInstance().postMessage(message)
 
-            # Save the DB locally in the temp folder. use file id as name to reduce collisions
-            lclDbPath = os.path.join(Temp_Dir, str(file.getId()) + '-amcache.hve')
-            ContentUtils.writeToFile(file, File(lclDbPath))
-            mydb = Temp_Dir + "\\" + str(file.getId()) + "-myAmcache.db3"
-            # Parse some keys
-            self.log(Level.INFO, "[Executable #1] Parsing Amcache.Hve: \"" + self.my_exe + "\" -r " + lclDbPath + " -d " + mydb)
-            subprocess.Popen([self.my_exe, '-r', lclDbPath, '-d', mydb]).communicate()[0] 
+        # The parse cache lives next to the VirusTotal cache. The scan works without it
+        self.parse_cache = ParseCache(self.connections, os.path.join(os.path.dirname(self.Cache_Path), "Amcache_Parse_Cache.db3"), self.PARSE_CACHE_ENTRIES)
+        try:
+            self.parse_cache.open()
+        except SQLException as e:
+            self.log(Level.INFO, "Could not open the parse cache " + self.parse_cache.db_path + " (" + e.getMessage() + ")")
+            self.parse_cache = None
 
-            try: 
-                Class.forName("org.sqlite.JDBC").newInstance()
-                dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % mydb)
-            except SQLException as e:
-                self.log(Level.INFO, "Could not open database file (not SQLite) " + mydb + " (" + e.getMessage() + ")")
-                return IngestModule.ProcessResult.OK
-             
-            
-            for am_table_name in self.List_Of_tables: 
-                if am_table_name == 'root_file_virustotal_scan': # <-- because we haven't run the executable these tables yet
-                    continue
-                if am_table_name == 'inventory_application_file_virustotal_scan':
-                    continue
+        try:
+            result = self.run_scan(skCase, hives, client, limiter, progressBar)
+        finally:
+            self.cache.close()
+            if self.parse_cache is not None:
                 try:
-                    stmt = dbConn.createStatement()
-                    resultSet = stmt.executeQuery("Select tbl_name from SQLITE_MASTER where lower(tbl_name) in ('" + am_table_name + "'); ")
-                    self.log(Level.INFO, "query SQLite Master table for " + am_table_name)
+                    self.parse_cache.close()
                 except SQLException as e:
-                    self.log(Level.INFO, "Error querying database for table " + am_table_name + " (" + e.getMessage() + ")")
-                    return IngestModule.ProcessResult.OK
+                    self.log(Level.INFO, "Error closing the parse cache (" + e.getMessage() + ")")
+            self.connections.close()
+            # Reported even when the job failed, when they are needed most.
+            # Guarded so a problem here doesn't hide the one that ended the job
+            try:
+                self.report_metrics(dataSource)
+            except:
+                self.log(Level.WARNING, "Could not report the metrics (" + str(sys.exc_info()[1]) + ")")
+        if result is not None:
+            return result
 
-                # Cycle through each row and create artifacts
-                while resultSet.next():
-                    try: 
-                        self.log(Level.INFO, "Result (" + resultSet.getString("tbl_name") + ")")
-                        table_name = resultSet.getString("tbl_name")
-                        SQL_String_1 = "Select * from " + table_name + ";"
-                        SQL_String_2 = "PRAGMA table_info('" + table_name + "')"
-                        artifact_name = "TSK_" + table_name.upper()
-                        artifact_desc = "Amcache " + table_name.upper()
-
-                        try:
-                            self.log(Level.INFO, "Begin Create New Artifacts")
-                            artID_amc = skCase.addArtifactType( artifact_name, artifact_desc)
-                        except:        
-                            self.log(Level.INFO, "Artifacts Creation Error, some artifacts may not exist now. ==> ")
-
-                        artID_amc = skCase.getArtifactTypeID(artifact_name)
-                        artID_amc_evt = skCase.getArtifactType(artifact_name)
-                       
-                        Column_Names = []
-                        Column_Types = []
-                        resultSet2  = stmt.executeQuery(SQL_String_2)
-                        while resultSet2.next(): 
-                            Column_Names.append(resultSet2.getString("name").upper())
-                            Column_Types.append(resultSet2.getString("type").upper())
-                            if resultSet2.getString("type").upper() == "TEXT":
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + resultSet2.getString("name").upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING, resultSet2.getString("name"))
-                                except:
-                                    self.log(Level.INFO, "Attributes Creation Error (string), " + resultSet2.getString("name") + " ==> ")
-                            elif resultSet2.getString("type").upper() == "":
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + resultSet2.getString("name").upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING, resultSet2.getString("name"))
-                                except:        
-                                    self.log(Level.INFO, "Attributes Creation Error (string2), " + resultSet2.getString("name") + " ==> ")
-                            else:
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + resultSet2.getString("name").upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.LONG, resultSet2.getString("name"))
-                                except:        
-                                    self.log(Level.INFO, "Attributes Creation Error (long), " + resultSet2.getString("name") + " ==> ")
-
-                                             
-                        resultSet3 = stmt.executeQuery(SQL_String_1)
-                        while resultSet3.next():
-                            art = file.newArtifact(artID_amc)
-                            Column_Number = 1
-                            for col_name in Column_Names:
-                                c_name = "TSK_" + col_name
-                                attID_ex1 = skCase.getAttributeType(c_name)
-                                if Column_Types[Column_Number - 1] == "TEXT":
-                                    art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, resultSet3.getString(Column_Number)))
-                                elif Column_Types[Column_Number - 1] == "":
-                                    art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, resultSet3.getString(Column_Number)))
-                                else:
-                                    art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, long(resultSet3.getInt(Column_Number))))
-                                Column_Number = Column_Number + 1
-                        IngestServices.getInstance().fireModuleDataEvent(ModuleDataEvent(AmcacheScanIngestModuleFactory.moduleName, artID_amc_evt, None))
-                            
-                    except SQLException as e:
-                        self.log(Level.INFO, "Error getting values from contacts table (" + e.getMessage() + ")")
+        message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " VirusTotal Scan Complete " ) 
+        IngestServices.getInstance().postMessage(message)
 
+        return IngestModule.ProcessResult.OK                
 
-                stmt.close()
-            dbConn.close()
-        message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " Amcache Keys Have Been Parsed " ) 
-        IngestServices.getInstance().postMessage(message)
-        message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " Beginning VirusTotal Scan " ) 
+    # Post the metrics of the job as an ingest message and save them as JSON
+    # in the module output folder, one file per job
+    def report_metrics(self, dataSource):
+        self.metrics.finish()
+        self.metrics.count("artifacts", self.artifacts.written)
+        self.metrics.count("attributes", self.artifacts.attributes_written)
+        self.metrics.add_time("write", self.artifacts.seconds)
+        message = IngestMessage.createMessage(IngestMessage.MessageType.INFO, "Amcache Scan", " Ingest Metrics ", self.metrics.summary())
         IngestServices.getInstance().postMessage(message)
+        Module_Dir = os.path.join(Case.getCurrentCase().getModuleDirectory(), "Amcache Scan")
+        Metrics_File = os.path.join(Module_Dir, "Metrics_" + time.strftime("%Y%m%d_%H%M%S", time.localtime(self.metrics.started)) + "_" + str(dataSource.getId()) + ".json")
+        try:
+            self.metrics.save(Metrics_File, dataSource.getName())
+            self.log(Level.INFO, "Metrics saved to " + Metrics_File)
+        except (IOError, OSError) as e:
+            self.log(Level.WARNING, "Could not save the metrics to " + Metrics_File + " (" + str(e) + ")")
+
+    # Pair each hive with the Amcache.hve.LOG1/LOG2 files in the same folder.
+    # Folders are matched by id, VSS copies and other volumes have the same paths.
+    # Returns a list of (hive, [transaction logs])
+    def find_transaction_logs(self, fileManager, dataSource, files):
+        log_files = {}
+        try:
+            for log_file in fileManager.findFiles(dataSource, "Amcache.hve.LOG%"):
+                if log_file.getSize() > 0:
+                    log_files.setdefault(log_file.getParent().getId(), []).append(log_file)
+        except TskCoreException as e:
+            self.log(Level.WARNING, "Could not find the Amcache transaction logs (" + e.getMessage() + ")")
 
+        hives = []
         for file in files:
+            try:
+                hive_logs = log_files.get(file.getParent().getId(), [])
+            except TskCoreException as e:
+                hive_logs = []
+            self.log(Level.INFO, file.getParentPath() + file.getName() + ": " + str(len(hive_logs)) + " transaction logs")
+            hives.append((file, hive_logs))
+        return hives
+
+    # Parse the hives and scan their SHA1 hashes as a pipeline:
+    #  - a pool of parser threads parses the hives and feeds the new hashes
+    #    into a bounded queue,
+    #  - a pool of worker threads sends them to VirusTotal within the rate limit,
+    #  - this (the ingest) thread is the only one writing to the blackboard. It
+    #    creates the registry artifacts of each parsed hive and the VirusTotal
+    #    artifacts of a hive as soon as all of its hashes are resolved.
+    # Returns a ProcessResult if the job has to stop early, otherwise None
+    def run_scan(self, skCase, hives, client, limiter, progressBar):
+        self.events = Queue.Queue()
+        self.hash_queue = Queue.Queue(self.HASH_QUEUE_SIZE)
+        self.stop = threading.Event()
+        self.staged = []        # [file, scan_rows, unresolved hashes] for each parsed hive
+        self.resolved = set()   # hashes with a result, or whose lookup failed
+        self.results = {}
+        self.row_counts = {}
+        self.count = 0
+        self.sum = 0
+
+        # Differential mode: hives are compared oldest (by modified time) first
+        ordered = sorted(hives, key=lambda hive: (hive[0].getMtime(), hive[0].getId()))
+        self.hive_index = dict([(file.getId(), index) for index, (file, log_files) in enumerate(ordered)])
+        self.parsed_hives = []
+        self.entries = {}           # table -> {(key path, last written): entry}
+        self.key_hives = {}         # (table, key path) -> hives the key is in, any version
+        self.diff_columns = {}
+        self.posted_scan_rows = set()
+
+        if self.Private:
+            num_workers = self.VIRUSTOTAL_WORKERS
+        else:
+            num_workers = 1
+        hive_queue = Queue.Queue()
+        for hive in hives:
+            hive_queue.put(hive)
+        num_parsers = max(1, min(len(hives), self.PARSER_THREADS, Runtime.getRuntime().availableProcessors()))
+        self.log(Level.INFO, "Parsing " + str(len(hives)) + " hives with " + str(num_parsers) + " threads")
+        self.seen = set()       # hashes already queued or looked up in the cache
+        self.parsing = {}       # hive hash -> Event set once that hive is parsed
+        self.parse_lock = threading.Lock()
+        self.parsers_running = num_parsers
+
+        threads = []
+        for i in range(num_parsers):
+            threads.append(threading.Thread(target=self.parse_hives, args=(hive_queue, num_workers)))
+        for i in range(num_workers):
+            threads.append(threading.Thread(target=self.scan_hashes, args=(client, limiter)))
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+
+        try:
+            # The parsers send a single "parsed" event between them, each worker a "done" event
+            result = self.write_events(skCase, num_workers + 1, progressBar)
+        finally:
+            # Stop the threads however write_events ended and drop the hashes
+            # still queued, then wait for them so nothing uses the cache after
+            # it is closed
+            self.stop.set()
+            while True:
+                try:
+                    self.hash_queue.get_nowait()
+                except Queue.Empty:
+                    break
+            for thread in threads:
+                thread.join()
+
+        if result is None and self.Differential:
+            self.post_diff_artifacts(skCase)
+        return result
+
+    # Handle the events of the parser and worker threads until all of them are done
+    def write_events(self, skCase, running, progressBar):
+        while running > 0:
 
             # Check if the user pressed cancel while we were busy
             if self.context.isJobCancelled():
                 return IngestModule.ProcessResult.OK
 
-            self.log(Level.INFO, "Processing file: " + file.getName())
-            fileCount += 1
-
-            # Save the DB locally in the temp folder. use file id as name to reduce collisions
-            mydb = Temp_Dir + "\\" + str(file.getId()) + "-myAmcache.db3"
-
             try:
-                Class.forName("org.sqlite.JDBC").newInstance()
-                dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % mydb)
-            except SQLException as e:
-                self.Error_Message.setText("Error Opening Settings")
+                event = self.events.get(True, 1)
+            except Queue.Empty:
+                continue
+
+            if event[0] == "hive":
+                file, tables, scan_rows = event[1:]
+                if self.Differential:
+                    self.merge_hive(file, tables)
+                else:
+                    self.post_hive_artifacts(skCase, file, tables)
+                self.add_hive(file, scan_rows, progressBar)
+            elif event[0] == "results":
+                self.resolve(event[1], event[2], progressBar)
+            elif event[0] == "parsed":
+                message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " Amcache Keys Have Been Parsed " ) 
+                IngestServices.getInstance().postMessage(message)
+                running -= 1
+            elif event[0] == "quota":
+                message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " VirusTotal daily request limit reached, remaining hashes were not scanned " )
+                IngestServices.getInstance().postMessage(message)
+            elif event[0] == "done":
+                running -= 1
+
+            while self.write_finished_hive(skCase):
+                pass
+        return None
+
+    # Parser thread: take hives off the queue until it is empty, parse each one
+    # and queue the hashes it adds that are not in the cache. Each hash is only
+    # ever queued once, no matter how many rows, tables or hives (VSS, RegBack)
+    # it appears in. The last parser thread to finish stops the workers
+    def parse_hives(self, hive_queue, num_workers):
+        try:
+            while not self.stopping():
+                try:
+                    (file, log_files) = hive_queue.get_nowait()
+                except Queue.Empty:
+                    return
+                staged_hive = self.stage_hive(file, log_files)
+                if staged_hive is None:
+                    continue
+                tables, scan_rows = staged_hive
 
-            # First check that the 'root_file' table exists
-            try:
-                stmt = dbConn.createStatement()
-                SQL_Statement = 'SELECT COUNT(*) as count FROM sqlite_master WHERE type = "table" AND name = "root_file";'
-                resultSet = stmt.executeQuery(SQL_Statement)
-                self.root_file_exists = int(resultSet.getString("count"))
-            except:
-                self.log(Level.INFO, "LOOK HERE: it's not working.")
+                new_hashes = []
+                with self.parse_lock:
+                    for table_name, path_column in self.List_Of_Scan_Tables:
+                        for (path, sha1) in scan_rows[table_name]:
+                            if sha1 not in self.seen:
+                                self.seen.add(sha1)
+                                new_hashes.append(sha1)
 
-            # If it does, count the number of rows in the table
-            if self.root_file_exists: 
-                self.log(Level.INFO, "root_file table exists. Counting rows.")
+                # Anything already in the local cache does not need to go to VirusTotal
                 try:
-                    stmt = dbConn.createStatement()
-                    SQL_Statement = 'SELECT count(*) AS count FROM root_file;'
-                    resultSet = stmt.executeQuery(SQL_Statement)
-                    self.root_file_count = int(resultSet.getString("count"))
-                except:
-                    self.log(Level.INFO, "LOOK HERE: it's not working.")
-
-            # Now check that the 'inventory_application_file' table exists
+                    cached = self.cache.get_many(new_hashes)
+                except SQLException as e:
+                    self.log(Level.INFO, "Error reading the VirusTotal cache (" + e.getMessage() + ")")
+                    cached = {}
+                self.log(Level.INFO, file.getName() + ": " + str(len(new_hashes)) + " new hashes, " + str(len(cached)) + " found in cache")
+                self.metrics.count("hashes", len(new_hashes))
+                self.metrics.count("hashes_from_cache", len(cached))
+
+                self.events.put(("hive", file, tables, scan_rows))
+                self.events.put(("results", cached.keys(), cached))
+                for sha1 in new_hashes:
+                    if sha1 not in cached and not self.queue_put(sha1):
+                        return
+        finally:
+            with self.parse_lock:
+                self.parsers_running -= 1
+                last_parser = self.parsers_running == 0
+            if last_parser:
+                for i in range(num_workers):
+                    self.queue_put(None)
+                self.events.put(("parsed",))
+
+    # True once the job is cancelled or the ingest thread has stopped writing
+    def stopping(self):
+        return self.stop.isSet() or self.context.isJobCancelled()
+
+    # Put a hash on the bounded queue, waiting for room. Returns False if the job is stopping
+    def queue_put(self, sha1):
+        while True:
+            if self.stopping():
+                return False
             try:
-                stmt = dbConn.createStatement()
-                SQL_Statement = 'SELECT COUNT(*) as count FROM sqlite_master WHERE type = "table" AND name = "inventory_application_file";'
-                resultSet = stmt.executeQuery(SQL_Statement)
-                self.inventory_application_file_exists = int(resultSet.getString("count"))
-            except:
-                self.log(Level.INFO, "LOOK HERE: it's not working.")
+                self.hash_queue.put(sha1, True, 1)
+                return True
+            except Queue.Full:
+                continue
 
-            # If it does, count the number of rows in the table
-            if self.inventory_application_file_exists:
-                self.log(Level.INFO, "inventory_application_file table exists. Counting rows.")
+    # Worker thread: take batches of hashes off the queue and look them up in VirusTotal
+    def scan_hashes(self, client, limiter):
+        try:
+            finished = False
+            while not finished and not self.stopping():
                 try:
-                    stmt = dbConn.createStatement()
-                    SQL_Statement = 'SELECT count(*) AS count FROM inventory_application_file;'
-                    resultSet = stmt.executeQuery(SQL_Statement)
-                    self.inventory_application_file_count = int(resultSet.getString("count"))
-                except:
-                    self.log(Level.INFO, "LOOK HERE: it's not working.")
-            stmt.close()
-            dbConn.close()
-
-            # Now we know how many files we need to scan
-            # Use the sum, to give the user a progress bar
-            self.sum = self.root_file_count + self.inventory_application_file_count
-            progressBar.switchToDeterminate(self.sum)
-
-            artifact_name = "TSK_" + 'root_file_virustotal_scan'.upper()
-            artifact_desc = "Amcache " + 'root_file_virustotal_scan'.upper()
-
-            try:
-                self.log(Level.INFO, "Begin creating root_file_virustotal_scan Artifacts")
-                artID_amc = skCase.addArtifactType(artifact_name, artifact_desc)
-            except:        
-                self.log(Level.INFO, "ARTIFACTS CREATION ERROR: root_file_virustotal_scan")
-
-            artID_typeID = skCase.getArtifactTypeID(artifact_name)
-            artID_type = skCase.getArtifactType(artifact_name)
-
-            Column_Names = ["p_key","file","sha1","vt_positives","vt_ratio","vt_report_link"]
-            Column_Types = ["int","text","text","int","text","text"]
-
-            # A public VirusTotal API key only allows for 4 requests a minute (1/15 seconds)
-            # Use this to track how much time has passed
-            current_time = time.time()
-
-            # start scanning root_file SHA1 hashes
-            for i in range(0, self.root_file_count):
-                subprocess.Popen([self.my_exe,'-d', mydb, '-a', self.API_Key, '-t', 'root_file', '-k', str(i + 1)]).communicate()[0]
-                try: 
-                    Class.forName("org.sqlite.JDBC").newInstance()
-                    dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % mydb)
-                except SQLException as e:
-                    self.log(Level.INFO, "Could not open database file (not SQLite) " + mydb + " (" + e.getMessage() + ")")
-                    return IngestModule.ProcessResult.OK
+                    sha1 = self.hash_queue.get(True, 1)
+                except Queue.Empty:
+                    continue
+                if sha1 is None:
+                    break
 
-                if i == 0:
+                # Fill the batch with whatever else is already waiting
+                batch = [sha1]
+                while len(batch) < client.batch_size:
                     try:
-                        stmt = dbConn.createStatement()
-                        resultSet = stmt.executeQuery('SELECT COUNT(*) as count FROM sqlite_master WHERE type = "table" AND name = "root_file_virustotal_scan";')
-                        self.log(Level.INFO, "query SQLite Master table for root_file_virustotal_scan")
-                    except SQLException as e:
-                       self.log(Level.INFO, "Error querying database for table root_file_virustotal_scan (" + e.getMessage() + ")")
-                    if int(resultSet.getString("count")):
-                        self.log(Level.INFO, "root_file_virustotal_scan found")
-                        for j in range(0,len(Column_Names)):
-                            if Column_Types[j].upper() == "TEXT":
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + Column_Names[j].upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING, Column_Names[j])
-                                except:        
-                                    self.log(Level.INFO, "Attributes Creation Error, " + Column_Names[j] + " ==> ")
-                            else:
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + Column_Names[j].upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.LONG, Column_Names[j])
-                                except:        
-                                    self.log(Level.INFO, "Attributes Creation Error, " + Column_Names[j] + " ==> ")
-                    stmt.close()
-
-                SQL_String_1 = 'SELECT "p_key","file","sha1","vt_positives","vt_ratio","vt_report_link" from "root_file_virustotal_scan" WHERE p_key = ' + str(i + 1) + ';'
-                stmt = dbConn.createStatement()
-                resultSet3 = stmt.executeQuery(SQL_String_1)
-                while resultSet3.next():
-                    art = file.newArtifact(artID_typeID)
-                    Column_Number = 1
-                    for col_name in Column_Names:
-                        c_name = "TSK_" + col_name.upper()
-                        attID_ex1 = skCase.getAttributeType(c_name)
-                        if Column_Types[Column_Number - 1].upper() == "TEXT":
-		                    art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, resultSet3.getString(col_name)))
-                        elif Column_Types[Column_Number - 1] == "":
-                            art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, resultSet3.getString(col_name)))
-                        else:
-                            art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, long(resultSet3.getInt(col_name))))
-                        Column_Number = Column_Number + 1
-                IngestServices.getInstance().fireModuleDataEvent(ModuleDataEvent(AmcacheScanIngestModuleFactory.moduleName, artID_type, None))
-                stmt.close()
-                dbConn.close()
+                        sha1 = self.hash_queue.get_nowait()
+                    except Queue.Empty:
+                        break
+                    if sha1 is None:
+                        finished = True
+                        break
+                    batch.append(sha1)
+
+                started = time.time()
+                acquired = limiter.acquire(self.stopping)
+                self.metrics.observe("virustotal_wait", time.time() - started)
+                if not acquired:
+                    if limiter.exhausted():
+                        self.log(Level.WARNING, "VirusTotal daily request limit reached, " + str(len(batch)) + " hashes were not scanned")
+                        if limiter.report_exhausted():
+                            self.events.put(("quota",))
+                        self.events.put(("results", batch, {}))
+                    continue
+                try:
+                    self.cache.count_request(limiter.day)
+                except SQLException as e:
+                    self.log(Level.INFO, "Error counting VirusTotal request (" + e.getMessage() + ")")
 
-                if not self.Private:
-                    after_time = time.time()
-                    diff = current_time - after_time
-                    time.sleep(15 - diff)
-                    current_time = time.time()
-                    if self.context.isJobCancelled():
-                        return IngestModule.ProcessResult.OK
-                self.count += 1
-                progressBar.progress(self.count)
+                started = time.time()
+                try:
+                    batch_results = client.lookup(batch)
+                except (IOError, ValueError) as e:
+                    self.log(Level.WARNING, "VirusTotal lookup failed (" + str(e) + ")")
+                    self.metrics.count("virustotal_failures")
+                    batch_results = {}
+                self.metrics.observe("virustotal_latency", time.time() - started)
+                self.metrics.count("virustotal_requests")
+                try:
+                    self.cache.put_many(batch_results)
+                except SQLException as e:
+                    self.log(Level.INFO, "Error writing to the VirusTotal cache (" + e.getMessage() + ")")
+                self.events.put(("results", batch, batch_results))
+        finally:
+            self.events.put(("done",))
+
+    # Start tracking the rows of a parsed hive
+    def add_hive(self, file, scan_rows, progressBar):
+        unresolved = set()
+        for table_name, path_column in self.List_Of_Scan_Tables:
+            self.sum += len(scan_rows[table_name])
+            for (path, sha1) in scan_rows[table_name]:
+                if sha1 in self.resolved:
+                    self.count += 1
+                    continue
+                self.row_counts[sha1] = self.row_counts.get(sha1, 0) + 1
+                unresolved.add(sha1)
+        self.staged.append([file, scan_rows, unresolved])
+        progressBar.switchToDeterminate(self.sum)
+        progressBar.progress(self.count)
+
+    # Record the results for a list of hashes. Hashes without a result are
+    # resolved too, their rows just don't get a VirusTotal artifact.
+    def resolve(self, hashes, results, progressBar):
+        self.results.update(results)
+        for sha1 in hashes:
+            self.resolved.add(sha1)
+            self.count += self.row_counts.pop(sha1, 0)
+            for staged_hive in self.staged:
+                staged_hive[2].discard(sha1)
+        progressBar.progress(self.count)
+
+    # Create the VirusTotal artifacts of the first hive that has all of its
+    # hashes resolved. Returns False if no hive is ready yet.
+    def write_finished_hive(self, skCase):
+        for staged_hive in self.staged:
+            file, scan_rows, unresolved = staged_hive
+            if unresolved:
+                continue
+            self.staged.remove(staged_hive)
+
+            for table_name, path_column in self.List_Of_Scan_Tables:
+                scan_table_name = table_name + "_virustotal_scan"
+                rows = []
+                for (path, sha1) in scan_rows[table_name]:
+                    if sha1 in self.results:
+                        # The other hives already have this file's result in differential mode
+                        if self.Differential:
+                            if (table_name, path, sha1) in self.posted_scan_rows:
+                                continue
+                            self.posted_scan_rows.add((table_name, path, sha1))
+                        positives, ratio, report_link = self.results[sha1]
+                        rows.append([len(rows) + 1, path, sha1, positives, ratio, report_link])
+                if rows:
+                    self.post_scan_artifacts(skCase, file, scan_table_name, rows)
+            return True
+        return False
+
+    # Parse one Amcache.hve straight from the image, with its transaction
+    # logs replayed, and collect the SHA1 hashes to scan. Runs on the parser thread.
+    # Returns (tables, scan rows), or None if the hive could not be parsed
+    def stage_hive(self, file, log_files):
+        self.log(Level.INFO, "Processing file: " + file.getName())
 
-            artifact_name = "TSK_" + 'inventory_application_file_virustotal_scan'.upper()
-            artifact_desc = "Amcache " + 'inventory_application_file_virustotal_scan'.upper()
+        try:
+            tables = self.cached_parse(file, log_files)
+        except (IOError, ValueError, OverflowError, struct.error) as e:
+            self.log(Level.WARNING, "Could not parse " + file.getName() + " (" + str(e) + ")")
+            return None
+
+        # The (file path, SHA1) pairs to look up in VirusTotal. Amcache stores
+        # the Root\File SHA1 with four leading zeros, so only the last 40
+        # characters are kept.
+        scan_rows = {}
+        for table_name, path_column in self.List_Of_Scan_Tables:
+            scan_rows[table_name] = []
+            if table_name not in tables:
+                continue
+            Column_Names, Column_Types, rows = tables[table_name]
+            path_index = Column_Names.index(path_column.upper())
+            sha1_index = Column_Names.index("SHA1")
+            for row in rows:
+                if row[sha1_index]:
+                    scan_rows[table_name].append((row[path_index], row[sha1_index][-40:].lower()))
+        return (tables, scan_rows)
+
+    # Parse a hive unless a hive with the same content (and transaction logs)
+    # is in the parse cache. When the same hive is found twice in a job, the
+    # second parser thread waits for the first one and takes its result
+    def cached_parse(self, file, log_files):
+        if self.parse_cache is None:
+            return self.parse_hive(file, log_files)
+
+        hive_hash = self.hive_hash(file, log_files)
+        with self.parse_lock:
+            parsing = self.parsing.get(hive_hash)
+            if parsing is None:
+                self.parsing[hive_hash] = threading.Event()
+        if parsing is not None:
+            while not parsing.isSet() and not self.stopping():
+                parsing.wait(1)
 
+        try:
             try:
-                self.log(Level.INFO, "Begin creating inventory_application_file_virustotal_scan Artifacts")
-                artID_amc = skCase.addArtifactType(artifact_name, artifact_desc)
-            except:        
-                self.log(Level.INFO, "ARTIFACTS CREATION ERROR: inventory_application_file_virustotal_scan")
-
-            artID_typeID = skCase.getArtifactTypeID(artifact_name)
-            artID_type = skCase.getArtifactType(artifact_name)
-
-            # start scanning 'inventory_application_file' SHA1 hashes
-            for i in range(0, self.inventory_application_file_count):
-                subprocess.Popen([self.my_exe,'-d', mydb, '-a', self.API_Key, '-t', 'inventory_application_file', '-k', str(i + 1)]).communicate()[0]
-                try: 
-                    Class.forName("org.sqlite.JDBC").newInstance()
-                    dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % mydb)
-                except SQLException as e:
-                    self.log(Level.INFO, "Could not open database file (not SQLite) " + mydb + " (" + e.getMessage() + ")")
-                    return IngestModule.ProcessResult.OK
-
-                if i == 0:
-                    try:
-                        stmt = dbConn.createStatement()
-                        resultSet = stmt.executeQuery('SELECT COUNT(*) as count FROM sqlite_master WHERE type = "table" AND name = "inventory_application_file_virustotal_scan";')
-                        self.log(Level.INFO, "query SQLite Master table for inventory_application_file_virustotal_scan")
-                    except SQLException as e:
-                       self.log(Level.INFO, "Error querying database for table inventory_application_file_virustotal_scan (" + e.getMessage() + ")")
-                    if int(resultSet.getString("count")):
-                        self.log(Level.INFO, "inventory_application_file_virustotal_scan found")
-                        for j in range(0,len(Column_Names)):
-                            if Column_Types[j].upper() == "TEXT":
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + Column_Names[j].upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING, Column_Names[j])
-                                except:        
-                                    self.log(Level.INFO, "Attributes Creation Error, " + Column_Names[j] + " ==> ")
-                            else:
-                                try:
-                                    attID_ex1 = skCase.addArtifactAttributeType("TSK_" + Column_Names[j].upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.LONG, Column_Names[j])
-                                except:        
-                                    self.log(Level.INFO, "Attributes Creation Error, " + Column_Names[j] + " ==> ")
-                    stmt.close()
-
-                SQL_String_1 = 'SELECT "p_key","file","sha1","vt_positives","vt_ratio","vt_report_link" from "inventory_application_file_virustotal_scan" WHERE p_key = ' + str(i + 1) + ';'
-                stmt = dbConn.createStatement()
-                resultSet3 = stmt.executeQuery(SQL_String_1)
-                while resultSet3.next():
-                    art = file.newArtifact(artID_typeID)
-                    Column_Number = 1
-                    for col_name in Column_Names:
-                        c_name = "TSK_" + col_name.upper()
-                        attID_ex1 = skCase.getAttributeType(c_name)
-                        if Column_Types[Column_Number - 1].upper() == "TEXT":
-		                    art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, resultSet3.getString(col_name)))
-                        elif Column_Types[Column_Number - 1] == "":
-                            art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, resultSet3.getString(col_name)))
-                        else:
-                            art.addAttribute(BlackboardAttribute(attID_ex1, AmcacheScanIngestModuleFactory.moduleName, long(resultSet3.getInt(col_name))))
-                        Column_Number = Column_Number + 1
-                IngestServices.getInstance().fireModuleDataEvent(ModuleDataEvent(AmcacheScanIngestModuleFactory.moduleName, artID_type, None))
-                stmt.close()
-                dbConn.close()
-
-                if not self.Private:
-                    after_time = time.time()
-                    diff = current_time - after_time
-                    time.sleep(15 - diff)
-                    if self.context.isJobCancelled():
-                        return IngestModule.ProcessResult.OK
-                    current_time = time.time()
-                self.count += 1
-                progressBar.progress(self.count)
-        message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " VirusTotal Scan Complete " ) 
+                tables = self.parse_cache.get(hive_hash)
+            except SQLException as e:
+                self.log(Level.INFO, "Error reading the parse cache (" + e.getMessage() + ")")
+                tables = None
+            if tables is not None:
+                self.log(Level.INFO, file.getName() + ": found in the parse cache (" + hive_hash + ")")
+                self.metrics.count("hives_from_parse_cache")
+                return tables
+
+            tables = self.parse_hive(file, log_files)
+            try:
+                self.parse_cache.put(hive_hash, tables)
+            except SQLException as e:
+                self.log(Level.INFO, "Error writing to the parse cache (" + e.getMessage() + ")")
+            return tables
+        finally:
+            if parsing is None:
+                self.parsing[hive_hash].set()
+
+    # Parse a hive straight from the image with its transaction logs replayed
+    def parse_hive(self, file, log_files):
+        reader = HivePageReader(file)
+        if log_files:
+            started = time.time()
+            try:
+                dirty_pages = TransactionLogReplay(reader).apply([HivePageReader(log_file) for log_file in log_files])
+                self.log(Level.INFO, file.getName() + ": applied " + str(dirty_pages) + " dirty pages from the transaction logs")
+            except (IOError, ValueError, struct.error) as e:
+                # Fall back to the hive as it is on disk
+                self.log(Level.WARNING, "Could not apply the transaction logs of " + file.getName() + " (" + str(e) + ")")
+                reader = HivePageReader(file)
+            self.metrics.add_time("log_replay", time.time() - started)
+        started = time.time()
+        tables = AmcacheParser().parse(RegistryHive(reader))
+        self.metrics.add_time("parse", time.time() - started)
+        self.metrics.count("hives_parsed")
+        self.metrics.count("rows_read", sum([len(rows) for (Column_Names, Column_Types, rows) in tables.values()]))
+        return tables
+
+    # The parse cache key of a hive: its MD5, combined with the MD5 of its
+    # transaction logs if it has any. The MD5 computed by the hash lookup
+    # module is used when there is one.
+    def hive_hash(self, file, log_files):
+        hive_md5 = self.file_md5(file)
+        if not log_files:
+            return hive_md5
+        log_md5s = sorted([self.file_md5(log_file) for log_file in log_files])
+        return hashlib.md5(hive_md5 + "".join(log_md5s)).hexdigest()
+
+    def file_md5(self, file):
+        md5 = file.getMd5Hash()
+        if md5:
+            return md5.lower()
+        started = time.time()
+        md5 = hashlib.md5()
+        buffer = jarray.zeros(self.HASH_BUFFER_SIZE, "b")
+        offset = 0
+        while offset < file.getSize():
+            try:
+                count = file.read(buffer, offset, self.HASH_BUFFER_SIZE)
+            except TskCoreException as e:
+                raise IOError("Error reading " + file.getName() + " (" + e.getMessage() + ")")
+            if count <= 0:
+                raise IOError("Short read from " + file.getName() + " at offset " + hex(offset))
+            md5.update(buffer.tostring()[:count])
+            offset += count
+        self.metrics.add_time("hash", time.time() - started)
+        self.metrics.count("bytes_hashed", offset)
+        return md5.hexdigest()
+
+    # Create the artifacts for the registry keys of a parsed hive
+    def post_hive_artifacts(self, skCase, file, tables):
+        for table_name in self.List_Of_tables:
+            if table_name not in tables:
+                continue
+            Column_Names, Column_Types, rows = tables[table_name]
+            self.post_table_artifacts(skCase, table_name, Column_Names, Column_Types, [(file, row) for row in rows])
+
+    # Create the artifacts for the rows of one table. file_rows is a list of
+    # (file the artifact goes on, row)
+    def post_table_artifacts(self, skCase, table_name, Column_Names, Column_Types, file_rows):
+        self.log(Level.INFO, "Result (" + table_name + ")")
+        artID_amc_evt = self.schema.artifact_type("TSK_" + table_name.upper(), "Amcache " + table_name.upper())
+        mapper = self.schema.row_mapper(AmcacheScanIngestModuleFactory.moduleName, Column_Names, Column_Types)
+        self.add_artifacts(table_name, artID_amc_evt, mapper, file_rows)
+
+    # Differential mode: fold the rows of a parsed hive into the entries seen
+    # so far. An entry is a registry key at one last written time, so a key
+    # that changed between hives gives one entry per version.
+    def merge_hive(self, file, tables):
+        index = self.hive_index[file.getId()]
+        self.parsed_hives.append(index)
+        for table_name in self.List_Of_tables:
+            if table_name not in tables:
+                continue
+            Column_Names, Column_Types, rows = tables[table_name]
+            self.diff_columns[table_name] = (Column_Names, Column_Types)
+            entries = self.entries.setdefault(table_name, {})
+            path_index = Column_Names.index("REGISTRY_KEY")
+            time_index = Column_Names.index("SOURCE_KEY_TIMESTAMP")
+            for row in rows:
+                path = row[path_index]
+                self.key_hives.setdefault((table_name, path), set()).add(index)
+                entry = entries.get((path, row[time_index]))
+                if entry is None:
+                    # [row, first hive, first file, last hive, last file, hives seen in]
+                    entries[(path, row[time_index])] = [row, index, file, index, file, 1]
+                    continue
+                entry[5] += 1
+                if index < entry[1]:
+                    entry[1], entry[2] = index, file
+                if index > entry[3]:
+                    entry[0], entry[3], entry[4] = row, index, file
+
+    # Differential mode: create one artifact per entry, on the newest hive it
+    # was seen in, with where it was first and last seen and how it changed
+    # between the oldest and the newest hive
+    def post_diff_artifacts(self, skCase):
+        if not self.parsed_hives:
+            return
+        oldest = min(self.parsed_hives)
+        newest = max(self.parsed_hives)
+        for table_name in self.List_Of_tables:
+            if table_name not in self.diff_columns:
+                continue
+            Column_Names, Column_Types = self.diff_columns[table_name]
+            path_index = Column_Names.index("REGISTRY_KEY")
+            time_index = Column_Names.index("SOURCE_KEY_TIMESTAMP")
+            file_rows = []
+            for (row, first_index, first_file, last_index, last_file, seen_in) in self.entries[table_name].values():
+                key_hives = self.key_hives[(table_name, row[path_index])]
+                changes = []
+                if first_index > oldest:
+                    if min(key_hives) < first_index:
+                        changes.append("modified")
+                    else:
+                        changes.append("added")
+                if last_index < newest:
+                    if max(key_hives) > last_index:
+                        changes.append("superseded")
+                    else:
+                        changes.append("removed")
+                if not changes:
+                    changes.append("unchanged")
+                file_rows.append((last_file, list(row) + [self.hive_name(first_file), self.hive_name(last_file), seen_in, ", ".join(changes)]))
+            # Number the entries again, the p_key of each hive's rows overlap
+            file_rows.sort(key=lambda file_row: (file_row[1][path_index], file_row[1][time_index]))
+            for p_key, (file, row) in enumerate(file_rows):
+                row[0] = p_key + 1
+            self.post_table_artifacts(skCase, table_name, Column_Names + self.Diff_Column_Names, Column_Types + self.Diff_Column_Types, file_rows)
+        message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Amcache Scan", " " + str(sum([len(entries) for entries in self.entries.values()])) + " unique entries in " + str(len(self.parsed_hives)) + " hives " )
         IngestServices.getInstance().postMessage(message)
 
-        return IngestModule.ProcessResult.OK                
+    # Path of a hive that tells VSS copies and data sources apart
+    def hive_name(self, file):
+        try:
+            return file.getUniquePath()
+        except TskCoreException:
+            return file.getParentPath() + file.getName()
+
+    # Create the artifacts for a <table_name>_virustotal_scan table
+    def post_scan_artifacts(self, skCase, file, scan_table_name, rows):
+        artID_type = self.schema.artifact_type("TSK_" + scan_table_name.upper(), "Amcache " + scan_table_name.upper())
+        mapper = self.schema.row_mapper(AmcacheScanIngestModuleFactory.moduleName, self.Scan_Column_Names, self.Scan_Column_Types)
+        self.add_artifacts(scan_table_name, artID_type, mapper, [(file, row) for row in rows])
+
+    # Create an artifact of artifact_type for each (file, row) of a table. A
+    # batch that can't be committed is logged and left out, the job goes on
+    # with the next one
+    def add_artifacts(self, table_name, artifact_type, mapper, file_rows):
+        for (file, row) in file_rows:
+            try:
+                self.artifacts.add(file, artifact_type, mapper.attributes(row))
+            except TskCoreException as e:
+                self.log(Level.SEVERE, "Could not commit a batch of " + table_name + " artifacts (" + str(e) + ")")
+        try:
+            self.artifacts.flush()
+        except TskCoreException as e:
+            self.log(Level.SEVERE, "Could not commit a batch of " + table_name + " artifacts (" + str(e) + ")")
+
+    # Count the artifacts of a batch whose commit failed. ArtifactWriter has
+    # already rolled it back
+    def discard_batch(self, dropped):
+        self.metrics.count("failed_batches")
+        self.metrics.count("failed_artifacts", dropped)
 
 
 # Stores the settings that can be changed for each ingest job
@@ -545,6 +2011,11 @@ class AmcacheScanWithUISettings(IngestModuleIngestJobSettings):
     def __init__(self):
         self.API_Key = ""
         self.API_Key_Type = False 
+        self.Cache_Path = ""
+        self.Cache_TTL = 30
+        self.Cache_Max_Entries = 100000
+        self.Private_Quota = 1000
+        self.Differential = False
 
     def getVersionNumber(self):
         return serialVersionUID
@@ -562,6 +2033,36 @@ class AmcacheScanWithUISettings(IngestModuleIngestJobSettings):
     def setPrivate(self, flag):
         self.Private = flag
 
+    def getCache_Path(self):
+        return self.Cache_Path
+
+    def setCache_Path(self, data):
+        self.Cache_Path = data
+
+    def getCache_TTL(self):
+        return self.Cache_TTL
+
+    def setCache_TTL(self, data):
+        self.Cache_TTL = data
+
+    def getCache_Max_Entries(self):
+        return self.Cache_Max_Entries
+
+    def setCache_Max_Entries(self, data):
+        self.Cache_Max_Entries = data
+
+    def getPrivate_Quota(self):
+        return self.Private_Quota
+
+    def setPrivate_Quota(self, data):
+        self.Private_Quota = data
+
+    def getDifferential(self):
+        return self.Differential
+
+    def setDifferential(self, flag):
+        self.Differential = flag
+
 # UI that is shown to user for each ingest job so they can configure the job.
 # TODO: Rename this
 class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
@@ -590,13 +2091,16 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         else:
             self.local_settings.setPrivate(False)
             self.local_settings.setAPI_Key(self.API_Key_TF.getText())
+        if self.Differential_CB.isSelected():
+            self.local_settings.setDifferential(True)
+        else:
+            self.local_settings.setDifferential(False)
 
     # Check to see if there are any entries that need to be populated from the database.        
     def check_Database_entries(self):
         head, tail = os.path.split(os.path.abspath(__file__)) 
         settings_db = head + "\\GUI_Settings.db3"
         try: 
-            Class.forName("org.sqlite.JDBC").newInstance()
             dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % settings_db)
         except SQLException as e:
             self.Error_Message.setText("Error Opening Settings DB!")
@@ -615,6 +2119,24 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
                         self.local_settings.setPrivate(True)
                     else:
                         self.local_settings.setPrivate(False)
+                if resultSet.getString("Setting_Name") == "Cache_Path":
+                    self.local_settings.setCache_Path(resultSet.getString("Setting_Value"))
+                # A number setting that doesn't read as one keeps its default
+                try:
+                    if resultSet.getString("Setting_Name") == "Cache_TTL":
+                        self.local_settings.setCache_TTL(int(resultSet.getString("Setting_Value")))
+                    if resultSet.getString("Setting_Name") == "Cache_Max_Entries":
+                        self.local_settings.setCache_Max_Entries(int(resultSet.getString("Setting_Value")))
+                    if resultSet.getString("Setting_Name") == "Private_Quota":
+                        # The rate limiter needs at least one request per minute
+                        self.local_settings.setPrivate_Quota(max(1, int(resultSet.getString("Setting_Value"))))
+                except (ValueError, TypeError):
+                    pass
+                if resultSet.getString("Setting_Name") == "Differential":
+                    if resultSet.getString("Setting_Value") == "1":
+                        self.local_settings.setDifferential(True)
+                    else:
+                        self.local_settings.setDifferential(False)
 
             self.Error_Message.setText("Settings Read successfully!")
         except SQLException as e:
@@ -629,7 +2151,6 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         head, tail = os.path.split(os.path.abspath(__file__)) 
         settings_db = head + "\\GUI_Settings.db3"
         try: 
-            Class.forName("org.sqlite.JDBC").newInstance()
             dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % settings_db)
         except SQLException as e:
             self.Error_Message.setText("Error Opening Settings")
@@ -650,6 +2171,42 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         except:
             pass
 
+        # These settings were added after GUI_Settings.db3 was first shipped, so their rows may not exist yet
+        try:
+            cache_ttl = int(self.Cache_TTL_TF.getText())
+            cache_max_entries = int(self.Cache_Max_Entries_TF.getText())
+            private_quota = int(self.Private_Quota_TF.getText())
+        except ValueError:
+            self.Error_Message.setText("Cache lifetime, cache size and requests per minute must be numbers")
+            stmt.close()
+            dbConn.close()
+            return
+        if private_quota < 1:
+            self.Error_Message.setText("Requests per minute must be at least 1")
+            stmt.close()
+            dbConn.close()
+            return
+        self.local_settings.setCache_Path(self.Cache_Path_TF.getText())
+        self.local_settings.setCache_TTL(cache_ttl)
+        self.local_settings.setCache_Max_Entries(cache_max_entries)
+        self.local_settings.setPrivate_Quota(private_quota)
+        try:
+            preparedStmt = dbConn.prepareStatement("INSERT OR REPLACE INTO settings (Setting_Name, Setting_Value) VALUES (?, ?);")
+            if self.local_settings.getDifferential():
+                differential = "1"
+            else:
+                differential = "0"
+            for name, value in [("Cache_Path", self.Cache_Path_TF.getText()), ("Cache_TTL", str(cache_ttl)), ("Cache_Max_Entries", str(cache_max_entries)), ("Private_Quota", str(private_quota)), ("Differential", differential)]:
+                preparedStmt.setString(1, name)
+                preparedStmt.setString(2, value)
+                preparedStmt.executeUpdate()
+            preparedStmt.close()
+        except SQLException as e:
+            self.Error_Message.setText("Error Saving Cache Settings")
+            stmt.close()
+            dbConn.close()
+            return
+
         self.Error_Message.setText("Settings Saved")
         stmt.close()
         dbConn.close()
@@ -715,11 +2272,140 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         self.gbPanel0.setConstraints( self.Private_API_Key_CB, self.gbcPanel0 ) 
         self.panel0.add( self.Private_API_Key_CB )
 
+        self.LabelB = JLabel("VirusTotal Cache Database (blank for module folder):")
+        self.LabelB.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 7 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelB, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelB ) 
+
+        self.Cache_Path_TF = JTextField(20) 
+        self.Cache_Path_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 9 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Cache_Path_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Cache_Path_TF ) 
+
+        self.LabelC = JLabel("Cache Lifetime (days):")
+        self.LabelC.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 10 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelC, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelC ) 
+
+        self.Cache_TTL_TF = JTextField(20) 
+        self.Cache_TTL_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 12 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Cache_TTL_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Cache_TTL_TF ) 
+
+        self.LabelD = JLabel("Cache Size (hashes):")
+        self.LabelD.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 13 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelD, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelD ) 
+
+        self.Cache_Max_Entries_TF = JTextField(20) 
+        self.Cache_Max_Entries_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 15 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Cache_Max_Entries_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Cache_Max_Entries_TF ) 
+
+        self.LabelE = JLabel("Private Key Requests per Minute:")
+        self.LabelE.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 16 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelE, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelE ) 
+
+        self.Private_Quota_TF = JTextField(20) 
+        self.Private_Quota_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 18 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Private_Quota_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Private_Quota_TF ) 
+
+        self.Differential_CB = JCheckBox("Differential Mode (one artifact per entry across all hives)", actionPerformed=self.checkBoxEvent)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 19 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Differential_CB, self.gbcPanel0 ) 
+        self.panel0.add( self.Differential_CB )
+
+        self.Blank_2 = JLabel( " ") 
+        self.Blank_2.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 20 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_2, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_2 ) 
+
         self.Save_Settings_BTN = JButton( "Save Settings", actionPerformed=self.SaveSettings) 
         self.Save_Settings_BTN.setEnabled(True)
         self.rbgPanel0.add( self.Save_Settings_BTN ) 
         self.gbcPanel0.gridx = 2 
-        self.gbcPanel0.gridy = 8
+        self.gbcPanel0.gridy = 21
         self.gbcPanel0.gridwidth = 1 
         self.gbcPanel0.gridheight = 1 
         self.gbcPanel0.fill = GridBagConstraints.BOTH 
@@ -732,7 +2418,7 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         self.Label_1 = JLabel( "Error Message:") 
         self.Label_1.setEnabled(True)
         self.gbcPanel0.gridx = 2 
-        self.gbcPanel0.gridy = 11
+        self.gbcPanel0.gridy = 23
         self.gbcPanel0.gridwidth = 1 
         self.gbcPanel0.gridheight = 1 
         self.gbcPanel0.fill = GridBagConstraints.BOTH 
@@ -745,7 +2431,7 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         self.Error_Message = JLabel( "") 
         self.Error_Message.setEnabled(True)
         self.gbcPanel0.gridx = 6
-        self.gbcPanel0.gridy = 11
+        self.gbcPanel0.gridy = 23
         self.gbcPanel0.gridwidth = 1 
         self.gbcPanel0.gridheight = 1 
         self.gbcPanel0.fill = GridBagConstraints.BOTH 
@@ -761,6 +2447,11 @@ class AmcacheScanWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
     def customizeComponents(self):
         self.check_Database_entries()
         self.Private_API_Key_CB.setSelected(self.local_settings.getPrivate())
+        self.Differential_CB.setSelected(self.local_settings.getDifferential())
+        self.Cache_Path_TF.setText(self.local_settings.getCache_Path())
+        self.Cache_TTL_TF.setText(str(self.local_settings.getCache_TTL()))
+        self.Cache_Max_Entries_TF.setText(str(self.local_settings.getCache_Max_Entries()))
+        self.Private_Quota_TF.setText(str(self.local_settings.getPrivate_Quota()))
 
     # Return the settings used
     def getSettings(self):
@@ -4,6 +4,8 @@
 #	- AWS Secret Key
 #	- Name of the S3 bucket containing the Cloud Trail logs to ingest
 #	- Region the S3 bucket is located in (i.e. us-east-1)
+# or a local folder or ZIP file holding a copy of the AWSLogs/ tree, or a
+# data source that holds one.
 #
 # Contact: Rebecca Anderson rander16 <at> GMU [dot] EDU
 #
@@ -34,11 +36,26 @@
 
 
 import jarray
-import inspect
+import sys
 import os
-import subprocess
 import time
 import re
+import json
+import gzip
+import hashlib
+import hmac
+import urllib
+import threading
+import Queue
+import StringIO
+import calendar
+import zlib
+import array
+import random
+import collections
+import bisect
+
+from xml.etree import ElementTree
 
 from javax.swing import JCheckBox
 from javax.swing import JButton
@@ -55,14 +72,24 @@ from javax.swing.filechooser import FileNameExtensionFilter
 
 from java.lang import Class
 from java.lang import System
-from java.sql  import DriverManager, SQLException
+from java.lang import Runtime
+from java.net import URL
+from java.sql  import DriverManager, SQLException, Types
 from java.util.logging import Level
+from java.util import ArrayList
+from java.util.zip import ZipFile
 from java.io import File
+from java.io import ByteArrayOutputStream
+from java.io import IOException
 from org.sleuthkit.datamodel import SleuthkitCase
 from org.sleuthkit.datamodel import AbstractFile
 from org.sleuthkit.datamodel import ReadContentInputStream
 from org.sleuthkit.datamodel import BlackboardArtifact
 from org.sleuthkit.datamodel import BlackboardAttribute
+from org.sleuthkit.datamodel import TskCoreException
+from org.sleuthkit.datamodel import TskDataException
+from org.sleuthkit.datamodel import TskData
+from org.sleuthkit.datamodel import VirtualDirectory
 from org.sleuthkit.autopsy.ingest import IngestModule
 from org.sleuthkit.autopsy.ingest.IngestModule import IngestModuleException
 from org.sleuthkit.autopsy.ingest import DataSourceIngestModule
@@ -73,13 +100,962 @@ from org.sleuthkit.autopsy.ingest import IngestMessage
 from org.sleuthkit.autopsy.ingest import IngestServices
 from org.sleuthkit.autopsy.ingest import ModuleDataEvent
 from org.sleuthkit.autopsy.coreutils import Logger
-from org.sleuthkit.autopsy.coreutils import PlatformUtil
 from org.sleuthkit.autopsy.casemodule import Case
 from org.sleuthkit.autopsy.casemodule.services import Services
 from org.sleuthkit.autopsy.casemodule.services import FileManager
 from org.sleuthkit.autopsy.datamodel import ContentUtils
 
 
+# The SQLite JDBC driver is registered once, when Autopsy loads the module
+Class.forName("org.sqlite.JDBC").newInstance()
+
+
+# ConnectionPool, SchemaRegistry, RowMapper, ArtifactWriter and JobMetrics
+# are the same in Amcache_Scan.py and Cloudtopsy.py. Autopsy loads each
+# python_modules folder on its own, so one module can't import them from the
+# other; change both copies together.
+
+
+# One SQLite connection per database file, opened the first time it is
+# used and kept until the pool is closed, along with the prepared statements
+# run on it. Each job has its own pool, so a database is opened once per job
+# instead of once per lookup.
+class ConnectionPool(object):
+
+    def __init__(self):
+        self.connections = {}
+        self.statements = {}
+        self.lock = threading.RLock()
+
+    def connection(self, db_path):
+        with self.lock:
+            if db_path not in self.connections:
+                self.connections[db_path] = DriverManager.getConnection("jdbc:sqlite:%s" % db_path)
+            return self.connections[db_path]
+
+    # Return the statement for sql on db_path, prepared the first time it is asked for.
+    # The pool owns the statement, callers must not close it
+    def prepare(self, db_path, sql):
+        with self.lock:
+            if (db_path, sql) not in self.statements:
+                self.statements[(db_path, sql)] = self.connection(db_path).prepareStatement(sql)
+            return self.statements[(db_path, sql)]
+
+    # Close the statements and connection of one database, or of all of them
+    def close(self, db_path=None):
+        with self.lock:
+            for (path, sql) in self.statements.keys():
+                if db_path is None or path == db_path:
+                    self.statements.pop((path, sql)).close()
+            for path in self.connections.keys():
+                if db_path is None or path == db_path:
+                    self.connections.pop(path).close()
+
+
+# Keeps the artifact and attribute types of a case. The existing types are
+# loaded once per case and only the missing ones are created, so nothing is
+# added just to fail with "already exists" and the row loops never go back
+# to the case database for a type.
+class SchemaRegistry(object):
+
+    # The registry of the open case, shared by every job of that case
+    current = None
+    current_lock = threading.Lock()
+
+    @staticmethod
+    def for_case(skCase):
+        with SchemaRegistry.current_lock:
+            if SchemaRegistry.current is None or SchemaRegistry.current.skCase is not skCase:
+                SchemaRegistry.current = SchemaRegistry(skCase)
+            return SchemaRegistry.current
+
+    def __init__(self, skCase):
+        self.skCase = skCase
+        self.lock = threading.RLock()
+        self.artifact_types = {}
+        for artifact_type in skCase.getArtifactTypes():
+            self.artifact_types[artifact_type.getTypeName()] = artifact_type
+        self.attribute_types = {}
+        for attribute_type in skCase.getAttributeTypes():
+            self.attribute_types[attribute_type.getTypeName()] = attribute_type
+        self.row_mappers = {}
+
+    # Return the artifact type called name, creating it if needed
+    def artifact_type(self, name, display_name):
+        with self.lock:
+            if name not in self.artifact_types:
+                try:
+                    self.artifact_types[name] = self.skCase.addBlackboardArtifactType(name, display_name)
+                except (TskDataException, TskCoreException):
+                    # Another client of a multi-user case added it after the types were loaded
+                    self.artifact_types[name] = self.skCase.getArtifactType(name)
+            return self.artifact_types[name]
+
+    # Return the attribute type called name, creating it if needed
+    def attribute_type(self, name, value_type, display_name):
+        with self.lock:
+            if name not in self.attribute_types:
+                try:
+                    self.attribute_types[name] = self.skCase.addArtifactAttributeType(name, value_type, display_name)
+                except (TskDataException, TskCoreException):
+                    self.attribute_types[name] = self.skCase.getAttributeType(name)
+            return self.attribute_types[name]
+
+    # Return the TSK_<COLUMN> attribute type of each column of a table, in
+    # column order. TEXT columns are strings, DATETIME columns are dates and
+    # the others are longs
+    def column_types(self, column_names, column_types):
+        attribute_types = []
+        for col_name, col_type in zip(column_names, column_types):
+            if col_type.upper() in ("TEXT", ""):
+                value_type = BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING
+            elif col_type.upper() == "DATETIME":
+                value_type = BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.DATETIME
+            else:
+                value_type = BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.LONG
+            attribute_types.append(self.attribute_type("TSK_" + col_name.upper(), value_type, col_name))
+        return attribute_types
+
+    # Return the RowMapper for a table, built the first time the table is seen
+    def row_mapper(self, module_name, column_names, column_types):
+        with self.lock:
+            key = (module_name, tuple(column_names), tuple(column_types))
+            if key not in self.row_mappers:
+                self.row_mappers[key] = RowMapper(module_name, self.column_types(column_names, column_types))
+            return self.row_mappers[key]
+
+
+# Turns the rows of a table into blackboard attributes. The conversion of
+# each column is picked once from the value type of its attribute type, so
+# the row loop makes one call per cell and never looks at the column types.
+class RowMapper(object):
+
+    DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y", "%Y-%m-%d"]
+
+    def __init__(self, module_name, attribute_types):
+        self.module_name = module_name
+        self.columns = []
+        for attribute_type in attribute_types:
+            value_type = attribute_type.getValueType()
+            if value_type == BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING:
+                extract = RowMapper.text
+            elif value_type == BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.DATETIME:
+                extract = RowMapper.epoch
+            else:
+                extract = RowMapper.number
+            self.columns.append((attribute_type, extract))
+
+    # Return the attributes of a row, a list of values in column order.
+    # Missing values, and dates that can't be read, are left out
+    def attributes(self, row):
+        attributes = ArrayList()
+        for (attribute_type, extract), value in zip(self.columns, row):
+            value = extract(value)
+            if value is not None:
+                attributes.add(BlackboardAttribute(attribute_type, self.module_name, value))
+        return attributes
+
+    @staticmethod
+    def text(value):
+        if value is None or isinstance(value, unicode):
+            return value
+        return unicode(value)
+
+    # Numbers are always longs, so sizes and FILETIMEs keep all 64 bits.
+    # None if the value is missing or isn't a number, so the attribute is left out
+    @staticmethod
+    def number(value):
+        if value is None or value == "":
+            return None
+        try:
+            return long(value)
+        except (ValueError, TypeError):
+            return None
+
+    # Seconds since 1970 from a number of seconds or a UTC date and time
+    # like "2016-02-15 08:53:20.123456 UTC", "2016-02-15T08:53:20Z",
+    # "02/15/2016 08:53:20" or "02/15/2016", None if there isn't one
+    @staticmethod
+    def epoch(value):
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, long)):
+            return long(value)
+        text = value.strip()
+        if text.endswith(" UTC"):
+            text = text[:-4]
+        text = text.rstrip("Z").replace("T", " ").split(".")[0]
+        for date_format in RowMapper.DATE_FORMATS:
+            try:
+                return long(calendar.timegm(time.strptime(text, date_format)))
+            except ValueError:
+                continue
+        return None
+
+
+# Writes artifacts in batches. The attributes of a row are added in one call,
+# and the attributes of each batch of rows are committed in a single case
+# database transaction followed by one ModuleDataEvent per artifact type in
+# the batch, instead of one write per attribute. The artifacts themselves
+# are created just before the transaction is opened, so they don't compete
+# with it for the SQLite write lock, and are deleted again if the batch
+# fails, so a failed batch leaves nothing in the case.
+class ArtifactWriter(object):
+
+    def __init__(self, skCase, module_name, batch_size):
+        self.skCase = skCase
+        self.module_name = module_name
+        self.batch_size = batch_size
+        self.pending = []    # (file, artifact type, attributes) not committed yet
+        self.written = 0
+        self.attributes_written = 0
+        self.seconds = 0.0    # spent committing
+        # Called after each commit, if set
+        self.committed = None
+        # Called with the number of rows dropped when a commit fails, if set
+        self.failed = None
+
+    # Queue an artifact of artifact_type (a BlackboardArtifact.Type) on file
+    # for the next commit
+    def add(self, file, artifact_type, attributes):
+        self.pending.append((file, artifact_type, attributes))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    # Commit the queued rows and let the UI know about them
+    def flush(self):
+        if not self.pending:
+            return
+        started = time.time()
+        created = []
+        try:
+            for (file, artifact_type, attributes) in self.pending:
+                created.append((file.newArtifact(artifact_type.getTypeID()), artifact_type))
+            trans = self.skCase.beginTransaction()
+            try:
+                for index in range(len(created)):
+                    created[index][0].addAttributes(self.pending[index][2], trans)
+                trans.commit()
+            except TskCoreException:
+                trans.rollback()
+                raise
+        except TskCoreException:
+            for (art, artifact_type) in created:
+                try:
+                    self.skCase.deleteBlackboardArtifact(art)
+                except TskCoreException:
+                    pass
+            dropped = len(self.pending)
+            self.pending = []
+            if self.failed is not None:
+                self.failed(dropped)
+            raise
+        new_artifacts = {}
+        for (art, artifact_type) in created:
+            if artifact_type.getTypeID() not in new_artifacts:
+                new_artifacts[artifact_type.getTypeID()] = (artifact_type, ArrayList())
+            new_artifacts[artifact_type.getTypeID()][1].add(art)
+        for (artifact_type, artifacts) in new_artifacts.values():
+            IngestServices.getInstance().fireModuleDataEvent(ModuleDataEvent(self.module_name, artifact_type, artifacts))
+        self.written += len(self.pending)
+        self.attributes_written += sum([attributes.size() for (file, artifact_type, attributes) in self.pending])
+        self.seconds += time.time() - started
+        self.pending = []
+        if self.committed is not None:
+            self.committed()
+
+
+# Counts and times what an ingest job does, so runs can be compared across
+# versions and machines. Phase times add up over every thread working on the
+# phase, so together they can be more than the elapsed time of the job.
+# Histograms count durations in power-of-two millisecond buckets. Rates are
+# a counter per second of a phase, or of the whole job. Used from several
+# threads at once.
+class JobMetrics(object):
+
+    def __init__(self, module_name, module_version):
+        self.module_name = module_name
+        self.module_version = module_version
+        self.started = time.time()
+        self.finished = None
+        self.phases = {}        # phase -> seconds
+        self.counters = {}
+        self.histograms = {}    # histogram -> [count, seconds, max seconds, {bucket ms: count}]
+        self.rates = []         # (name, counter, phase or None for the whole job)
+        self.lock = threading.Lock()
+
+    def add_time(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def observe(self, histogram, seconds):
+        bucket = 1
+        while bucket < seconds * 1000:
+            bucket = bucket * 2
+        with self.lock:
+            entry = self.histograms.setdefault(histogram, [0, 0.0, 0.0, {}])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3][bucket] = entry[3].get(bucket, 0) + 1
+
+    def add_rate(self, name, counter, phase=None):
+        self.rates.append((name, counter, phase))
+
+    def finish(self):
+        self.finished = time.time()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def rate_values(self):
+        values = {}
+        for (name, counter, phase) in self.rates:
+            if phase is None:
+                seconds = self.elapsed()
+            else:
+                seconds = self.phases.get(phase, 0.0)
+            if seconds > 0:
+                values[name] = self.counters.get(counter, 0) / seconds
+        return values
+
+    # The metrics as one line each, for the details of an ingest message
+    def summary(self):
+        lines = ["Elapsed: %.1f s" % self.elapsed()]
+        for name in sorted(self.counters):
+            lines.append("%s: %d" % (name, self.counters[name]))
+        for (name, value) in sorted(self.rate_values().items()):
+            lines.append("%s: %.1f" % (name, value))
+        for phase in sorted(self.phases):
+            lines.append("%s: %.1f s" % (phase, self.phases[phase]))
+        for name in sorted(self.histograms):
+            count, seconds, max_seconds, buckets = self.histograms[name]
+            lines.append("%s: %d, mean %.0f ms, max %.0f ms" % (name, count, seconds * 1000 / count, max_seconds * 1000))
+        return "<br>".join(lines)
+
+    # Write the metrics to a JSON file, with the machine they were taken on
+    def save(self, path, data_source):
+        histograms = {}
+        for (name, (count, seconds, max_seconds, buckets)) in self.histograms.items():
+            histograms[name] = {"count": count, "seconds": seconds, "max_seconds": max_seconds,
+                                "buckets_ms": [[bucket, buckets[bucket]] for bucket in sorted(buckets)]}
+        metrics = {"module": self.module_name,
+                   "version": self.module_version,
+                   "data_source": data_source,
+                   "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+                   "elapsed_seconds": self.elapsed(),
+                   "processors": Runtime.getRuntime().availableProcessors(),
+                   "max_memory": Runtime.getRuntime().maxMemory(),
+                   "phase_seconds": self.phases,
+                   "counters": self.counters,
+                   "rates": self.rate_values(),
+                   "histograms": histograms}
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        metrics_file = open(path, "w")
+        try:
+            json.dump(metrics, metrics_file, indent=2, sort_keys=True)
+        finally:
+            metrics_file.close()
+
+
+# Lists and downloads the objects of an S3 bucket with requests signed with
+# AWS Signature Version 4, so the logs can be read straight from the bucket.
+# Requests go through Java's HttpURLConnection, which keeps the connections
+# alive between requests, so the download threads don't pay for a new TLS
+# handshake per log object. Throttled and failed requests are retried.
+# With an endpoint URL the requests go to an S3-compatible store, such as
+# MinIO, instead, with the bucket in the path rather than in the host name.
+class S3Client(object):
+
+    NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+    EMPTY_PAYLOAD_HASH = hashlib.sha256("").hexdigest()
+    # Tries per request, waiting BACKOFF seconds after the first failure and
+    # twice as long after each one after that
+    RETRIES = 5
+    BACKOFF = 0.5
+    # S3 answers with these when it is throttling (SlowDown) or briefly unavailable
+    RETRY_STATUS = [429, 500, 502, 503, 504]
+    TIMEOUT_MS = 60000
+
+    def __init__(self, access_key, secret_key, region, bucket, endpoint=None):
+        # JobMetrics counting the retried requests, if set
+        self.metrics = None
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.bucket = bucket
+        if endpoint:
+            url = URL(endpoint)
+            self.protocol = url.getProtocol()
+            self.host = url.getHost()
+            if url.getPort() not in (-1, url.getDefaultPort()):
+                self.host = self.host + ":" + str(url.getPort())
+            self.bucket_path = "/" + bucket
+            self.name = endpoint.rstrip("/") + "/" + bucket
+        else:
+            self.protocol = "https"
+            self.host = bucket + ".s3." + region + ".amazonaws.com"
+            self.bucket_path = ""
+            self.name = bucket
+
+    # Yield the (key, size, ETag) of every object under prefix, in key order,
+    # starting after start_after if given.
+    # Raises IOError if the bucket can't be listed.
+    def list_objects(self, prefix, start_after=None):
+        for root in self.list_pages(prefix, None, start_after):
+            for contents in root.findall(self.NAMESPACE + "Contents"):
+                yield (contents.findtext(self.NAMESPACE + "Key"), int(contents.findtext(self.NAMESPACE + "Size")), (contents.findtext(self.NAMESPACE + "ETag") or "").strip('"'))
+
+    # Yield the "folders" directly under prefix, e.g. AWSLogs/<account>/ for AWSLogs/
+    def list_prefixes(self, prefix):
+        for root in self.list_pages(prefix, "/", None):
+            for common_prefix in root.findall(self.NAMESPACE + "CommonPrefixes"):
+                yield common_prefix.findtext(self.NAMESPACE + "Prefix")
+
+    # Yield the parsed ListObjectsV2 responses for prefix, one per page
+    def list_pages(self, prefix, delimiter, start_after):
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix}
+            if delimiter:
+                query["delimiter"] = delimiter
+            if token:
+                query["continuation-token"] = token
+            elif start_after:
+                query["start-after"] = start_after
+            root = ElementTree.fromstring(self.get("/", query))
+            yield root
+            token = root.findtext(self.NAMESPACE + "NextContinuationToken")
+            if root.findtext(self.NAMESPACE + "IsTruncated") != "true" or not token:
+                return
+
+    # Return the content of one object
+    def get_object(self, key):
+        return self.get("/" + key, {})
+
+    # Send a signed GET request and return the response body, retrying with
+    # an exponential backoff when S3 is throttling or the connection fails.
+    # Raises IOError if the request still fails
+    def get(self, path, query):
+        delay = self.BACKOFF
+        for attempt in range(self.RETRIES):
+            try:
+                status, body = self.send(path, query)
+            except (IOError, IOException) as e:
+                status, body = None, str(e)
+            if status == 200:
+                return body
+            if status is not None and status not in self.RETRY_STATUS:
+                raise IOError("HTTP " + str(status) + " for " + path + ": " + body[:200])
+            if attempt < self.RETRIES - 1:
+                if self.metrics is not None:
+                    self.metrics.count("s3_retries")
+                # Jitter keeps the download threads from retrying in step
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = delay * 2
+        raise IOError("Giving up on " + path + " after " + str(self.RETRIES) + " tries (" + str(status or body)[:200] + ")")
+
+    # Send one signed GET request and return (HTTP status, response body)
+    def send(self, path, query):
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        scope = amz_date[:8] + "/" + self.region + "/s3/aws4_request"
+        if self.bucket_path and path == "/":
+            canonical_uri = self.quote(self.bucket_path, "/~")
+        else:
+            canonical_uri = self.quote(self.bucket_path + path, "/~")
+        canonical_query = "&".join([self.quote(name, "-_.~") + "=" + self.quote(query[name], "-_.~") for name in sorted(query)])
+        canonical_headers = "host:" + self.host + "\nx-amz-content-sha256:" + self.EMPTY_PAYLOAD_HASH + "\nx-amz-date:" + amz_date + "\n"
+        signed_headers = "host;x-amz-content-sha256;x-amz-date"
+        canonical_request = "\n".join(["GET", canonical_uri, canonical_query, canonical_headers, signed_headers, self.EMPTY_PAYLOAD_HASH])
+        string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request).hexdigest()])
+
+        signing_key = "AWS4" + self.secret_key
+        for part in scope.split("/"):
+            signing_key = hmac.new(signing_key, part, hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign, hashlib.sha256).hexdigest()
+
+        url = self.protocol + "://" + self.host + canonical_uri
+        if canonical_query:
+            url = url + "?" + canonical_query
+        connection = URL(url).openConnection()
+        connection.setConnectTimeout(self.TIMEOUT_MS)
+        connection.setReadTimeout(self.TIMEOUT_MS)
+        connection.setRequestProperty("x-amz-date", amz_date)
+        connection.setRequestProperty("x-amz-content-sha256", self.EMPTY_PAYLOAD_HASH)
+        connection.setRequestProperty("Authorization", "AWS4-HMAC-SHA256 Credential=" + self.access_key + "/" + scope + ", SignedHeaders=" + signed_headers + ", Signature=" + signature)
+        status = connection.getResponseCode()
+        if status >= 400:
+            stream = connection.getErrorStream()
+        else:
+            stream = connection.getInputStream()
+        return (status, self.read_stream(stream))
+
+    # Read a response to the end and close it. A connection is only kept
+    # alive for the next request once its response has been read in full
+    @staticmethod
+    def read_stream(stream):
+        if stream is None:
+            return ""
+        try:
+            output = ByteArrayOutputStream()
+            buffer = jarray.zeros(65536, "b")
+            while True:
+                count = stream.read(buffer)
+                if count < 0:
+                    break
+                output.write(buffer, 0, count)
+            return output.toByteArray().tostring()
+        finally:
+            stream.close()
+
+    @staticmethod
+    def quote(value, safe):
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        return urllib.quote(value, safe)
+
+    # Connections are kept alive by Java, there is nothing to close
+    def close(self):
+        pass
+
+
+# Serves CloudTrail log objects that have already been copied out of a
+# bucket, in place of an S3Client. Subclasses fill objects with the
+# (key, size, None) of each log file and read them in get_object. Keys are cut
+# to start at AWSLogs/, whatever folder the tree was exported to, so the
+# same listing, checkpoint and filters work as for a bucket.
+class LogFileSource(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.objects = []
+        self.keys = []
+
+    # Sort the objects once they have all been found, so they can be
+    # listed in key order like a bucket
+    def sort(self):
+        self.objects.sort()
+        self.keys = [key for (key, size, etag) in self.objects]
+
+    # Return the key of a log file from its path, or None if the path isn't
+    # in an AWSLogs/ tree
+    @staticmethod
+    def log_key(path):
+        path = "/" + path.replace("\\", "/").lstrip("/")
+        index = path.find("/AWSLogs/")
+        if index < 0 or not path.endswith(".json.gz"):
+            return None
+        return path[index + 1:]
+
+    # Yield the (key, size, None) of every object under prefix, in key
+    # order, starting after start_after if given. Files have no ETag
+    def list_objects(self, prefix, start_after=None):
+        index = bisect.bisect_left(self.keys, prefix)
+        if start_after is not None:
+            index = max(index, bisect.bisect_right(self.keys, start_after))
+        while index < len(self.keys) and self.keys[index].startswith(prefix):
+            yield self.objects[index]
+            index += 1
+
+    # Yield the "folders" directly under prefix, e.g. AWSLogs/<account>/ for AWSLogs/
+    def list_prefixes(self, prefix):
+        last_folder = None
+        index = bisect.bisect_left(self.keys, prefix)
+        while index < len(self.keys) and self.keys[index].startswith(prefix):
+            rest = self.keys[index][len(prefix):]
+            if "/" in rest:
+                folder = prefix + rest.split("/")[0] + "/"
+                if folder != last_folder:
+                    last_folder = folder
+                    yield folder
+            index += 1
+
+    def close(self):
+        pass
+
+
+# Reads the log files under a local folder, or in a ZIP file, holding an
+# AWSLogs/ tree, e.g. one copied out of a bucket with "aws s3 sync".
+# Raises IOError if the folder or ZIP file can't be read
+class LocalLogSource(LogFileSource):
+
+    def __init__(self, path):
+        LogFileSource.__init__(self, "file:" + os.path.abspath(path))
+        self.path = path
+        self.zip_file = None
+        self.paths = {}
+        if os.path.isdir(path):
+            for (dir_path, dir_names, file_names) in os.walk(path):
+                for file_name in file_names:
+                    file_path = os.path.join(dir_path, file_name)
+                    self.add(os.path.relpath(file_path, path), file_path, os.path.getsize(file_path))
+        elif os.path.isfile(path):
+            try:
+                self.zip_file = ZipFile(path)
+                entries = self.zip_file.entries()
+                while entries.hasMoreElements():
+                    entry = entries.nextElement()
+                    if not entry.isDirectory():
+                        self.add(entry.getName(), entry, entry.getSize())
+            except IOException as e:
+                raise IOError("Could not read ZIP file " + path + " (" + str(e) + ")")
+        else:
+            raise IOError("No such folder or ZIP file: " + path)
+        self.sort()
+
+    def add(self, path, location, size):
+        key = self.log_key(path)
+        if key is not None and key not in self.paths:
+            self.paths[key] = location
+            self.objects.append((key, size, None))
+
+    # Return the content of one log file
+    def get_object(self, key):
+        if self.zip_file is None:
+            log_file = open(self.paths[key], "rb")
+            try:
+                return log_file.read()
+            finally:
+                log_file.close()
+        try:
+            return S3Client.read_stream(self.zip_file.getInputStream(self.paths[key]))
+        except IOException as e:
+            raise IOError(str(e))
+
+    def close(self):
+        if self.zip_file is not None:
+            self.zip_file.close()
+
+
+# Reads the log files of an AWSLogs/ tree that is part of the data source,
+# e.g. a disk image or logical files added to the case, without copying
+# them out of the case first
+class DataSourceLogSource(LogFileSource):
+
+    def __init__(self, fileManager, dataSource):
+        LogFileSource.__init__(self, "datasource:" + str(dataSource.getId()))
+        self.files = {}
+        for file in fileManager.findFiles(dataSource, "%.json.gz", "AWSLogs"):
+            key = self.log_key(file.getParentPath() + file.getName())
+            if key is not None and key not in self.files and file.getSize() > 0:
+                self.files[key] = file
+                self.objects.append((key, file.getSize(), None))
+        self.sort()
+
+    # Return the content of one log file
+    def get_object(self, key):
+        try:
+            return S3Client.read_stream(ReadContentInputStream(self.files[key]))
+        except IOException as e:
+            raise IOError(str(e))
+
+
+# Limits what is listed, downloaded and ingested to a time window, a set of
+# accounts and regions, and a set of event sources. Empty settings don't filter.
+# Log objects are filed under AWSLogs/<account>/CloudTrail/<region>/YYYY/MM/DD/
+# so the listing of each folder starts at the first day of the window and
+# stops after its last day.
+class CloudTrailFilter(object):
+
+    TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+    DAY = 24 * 60 * 60
+
+    # Raises ValueError if a time can't be parsed
+    def __init__(self, start_time, end_time, accounts, regions, event_sources):
+        self.start_time = self.parse_time(start_time, False)
+        self.end_time = self.parse_time(end_time, True)
+        self.accounts = self.parse_list(accounts)
+        self.regions = self.parse_list(regions)
+        self.event_sources = self.parse_list(event_sources)
+        if self.start_time is not None and self.end_time is not None and self.start_time > self.end_time:
+            raise ValueError("Start time is after end time")
+
+    # Seconds since the epoch for a UTC time, or None if text is empty. A date
+    # on its own is the start of the day, or its end for an end time.
+    @staticmethod
+    def parse_time(text, end):
+        text = text.strip() if text else ""
+        if not text:
+            return None
+        for time_format in CloudTrailFilter.TIME_FORMATS:
+            try:
+                seconds = calendar.timegm(time.strptime(text, time_format))
+            except ValueError:
+                continue
+            if end and time_format == "%Y-%m-%d":
+                seconds += CloudTrailFilter.DAY - 1
+            return seconds
+        raise ValueError("Invalid time " + text + ", expected YYYY-MM-DD or YYYY-MM-DD HH:MM")
+
+    @staticmethod
+    def parse_list(text):
+        return set([item.strip() for item in (text or "").split(",") if item.strip()])
+
+    # Identifies the window and event sources, runs with different ones keep separate checkpoints
+    def signature(self):
+        return str(self.start_time) + "|" + str(self.end_time) + "|" + ",".join(sorted(self.event_sources))
+
+    def keep_folder(self, account, region):
+        return (not self.accounts or account in self.accounts) and (not self.regions or region in self.regions)
+
+    # The key to start listing a log folder after, or None to list all of it
+    def first_key(self, log_prefix):
+        if self.start_time is None:
+            return None
+        return log_prefix + time.strftime("%Y/%m/%d", time.gmtime(self.start_time))
+
+    # True once the listing of a log folder is past the window. Objects are
+    # delivered up to a few minutes after their last event, so the day after
+    # the window is still listed.
+    def past_end(self, log_prefix, key):
+        if self.end_time is None:
+            return False
+        return key[len(log_prefix):len(log_prefix) + 10] > time.strftime("%Y/%m/%d", time.gmtime(self.end_time + self.DAY))
+
+    def keep_event(self, event):
+        if self.event_sources and event.get("eventSource") not in self.event_sources:
+            return False
+        if self.start_time is None and self.end_time is None:
+            return True
+        event_time = event.get("eventTime", "")
+        if self.start_time is not None and event_time < time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.start_time)):
+            return False
+        if self.end_time is not None and event_time > time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.end_time)):
+            return False
+        return True
+
+
+# Remembers, per case, which CloudTrail log objects and events have been
+# ingested so a later run only fetches what was delivered since. For each
+# (bucket, account, region, prefix) it keeps the last processed key. Objects
+# are listed again from the start of that key's day, since CloudTrail can
+# still deliver more objects for it, and the objects of that day that were
+# already processed are skipped without downloading them. Events are also
+# deduplicated by their CloudTrail eventID. Runs with a different time window
+# or event sources (filters) keep their own checkpoints.
+#
+# The events table is also a store of every event ingested into the case,
+# one row per event whatever its API. The fields that are searched on most
+# have their own indexed column and the whole event is kept as zlib
+# compressed JSON, so events can be queried across APIs outside Autopsy.
+class CloudTrailCheckpoint(object):
+
+    LOOKUP_CHUNK = 100
+
+    # (column, type, path to the field in the event) of the indexed columns of the events table
+    EVENT_COLUMNS = [
+        ("event_time", "int", ("eventTime",)),
+        ("event_name", "text", ("eventName",)),
+        ("event_source", "text", ("eventSource",)),
+        ("source_ip_address", "text", ("sourceIPAddress",)),
+        ("user_arn", "text", ("userIdentity", "arn")),
+        ("aws_region", "text", ("awsRegion",))]
+
+    def __init__(self, connections, db_path, bucket, filters):
+        self.connections = connections
+        self.db_path = db_path
+        self.bucket = bucket
+        self.filters = filters
+        self.dbConn = None
+        # The listing and ingest threads share the connection
+        self.lock = threading.RLock()
+        # Log objects are downloaded in parallel and can be saved out of order.
+        # The keys of each folder, in the order they were listed, that are not
+        # saved yet, so the checkpoint never moves past a key that isn't saved
+        self.unsaved = {}           # (account, region, prefix, log prefix) -> keys
+        self.saved_keys = set()     # saved keys still behind an unsaved one
+
+    def open(self):
+        self.dbConn = self.connections.connection(self.db_path)
+        stmt = self.dbConn.createStatement()
+        # Checkpoints from before the filters were added can't be told apart, start over
+        resultSet = stmt.executeQuery("SELECT COUNT(*) as count FROM pragma_table_info('checkpoint') WHERE name = 'filters';")
+        if not int(resultSet.getString("count")):
+            stmt.executeUpdate("DROP TABLE IF EXISTS checkpoint;")
+            stmt.executeUpdate("DROP TABLE IF EXISTS log_objects;")
+        stmt.executeUpdate("CREATE TABLE IF NOT EXISTS checkpoint (bucket text, account text, region text, prefix text, filters text, last_key text, updated_time int, PRIMARY KEY (bucket, account, region, prefix, filters));")
+        stmt.executeUpdate("CREATE TABLE IF NOT EXISTS log_objects (bucket text, filters text, key text, PRIMARY KEY (bucket, filters, key));")
+        stmt.executeUpdate("CREATE TABLE IF NOT EXISTS events (event_id text PRIMARY KEY);")
+        # The events table used to hold only the eventIDs, add the columns it is missing
+        resultSet = stmt.executeQuery("SELECT name FROM pragma_table_info('events');")
+        columns = set()
+        while resultSet.next():
+            columns.add(resultSet.getString("name"))
+        for (column, column_type, path) in self.EVENT_COLUMNS + [("log_key", "text", None), ("event", "blob", None)]:
+            if column not in columns:
+                stmt.executeUpdate("ALTER TABLE events ADD COLUMN " + column + " " + column_type + ";")
+        for (column, column_type, path) in self.EVENT_COLUMNS:
+            stmt.executeUpdate("CREATE INDEX IF NOT EXISTS events_" + column + " ON events (" + column + ");")
+        stmt.close()
+
+    # Returns the key to start listing log_prefix after, and the keys after it
+    # that were already processed
+    def start(self, account, region, prefix, log_prefix):
+        with self.lock:
+            preparedStmt = self.connections.prepare(self.db_path, "SELECT last_key FROM checkpoint WHERE bucket = ? AND account = ? AND region = ? AND prefix = ? AND filters = ?;")
+            preparedStmt.setString(1, self.bucket)
+            preparedStmt.setString(2, account)
+            preparedStmt.setString(3, region)
+            preparedStmt.setString(4, prefix)
+            preparedStmt.setString(5, self.filters)
+            resultSet = preparedStmt.executeQuery()
+            start_after = None
+            if resultSet.next():
+                start_after = self.day_of(log_prefix, resultSet.getString("last_key"))
+            if start_after is None:
+                return (None, set())
+
+            processed = set()
+            preparedStmt = self.connections.prepare(self.db_path, "SELECT key FROM log_objects WHERE bucket = ? AND filters = ? AND key > ? AND key < ?;")
+            preparedStmt.setString(1, self.bucket)
+            preparedStmt.setString(2, self.filters)
+            preparedStmt.setString(3, start_after)
+            preparedStmt.setString(4, log_prefix + u"\uffff")
+            resultSet = preparedStmt.executeQuery()
+            while resultSet.next():
+                processed.add(resultSet.getString("key"))
+            return (start_after, processed)
+
+    # The YYYY/MM/DD/ folder a log object key is in, e.g.
+    # AWSLogs/<account>/CloudTrail/<region>/2019/08/01/
+    @staticmethod
+    def day_of(log_prefix, key):
+        return key[:len(log_prefix) + len("YYYY/MM/DD/")]
+
+    # Note that a log object (account, region, prefix, log prefix, key) is
+    # about to be downloaded. Objects of a folder must be noted in key order
+    def listed(self, log_object):
+        with self.lock:
+            self.unsaved.setdefault(log_object[:4], collections.deque()).append(log_object[4])
+
+    # Returns the eventIDs of event_ids that are already in the case
+    def known_events(self, event_ids):
+        with self.lock:
+            known = set()
+            # Always LOOKUP_CHUNK ids per query so one prepared statement serves
+            # every chunk, the last one is padded by repeating its last id
+            preparedStmt = self.connections.prepare(self.db_path, "SELECT event_id FROM events WHERE event_id IN (" + ",".join(["?"] * self.LOOKUP_CHUNK) + ");")
+            for start in range(0, len(event_ids), self.LOOKUP_CHUNK):
+                chunk = event_ids[start:start + self.LOOKUP_CHUNK]
+                chunk = chunk + [chunk[-1]] * (self.LOOKUP_CHUNK - len(chunk))
+                for i in range(len(chunk)):
+                    preparedStmt.setString(i + 1, chunk[i])
+                resultSet = preparedStmt.executeQuery()
+                while resultSet.next():
+                    known.add(resultSet.getString("event_id"))
+                resultSet.close()
+            return known
+
+    # Record events whose artifacts have been committed, and the log objects
+    # all of whose events have been, in one transaction. log_objects is a list
+    # of (account, region, prefix, log prefix, key) and events a list of
+    # (key of the log object, event).
+    def save(self, log_objects, events):
+        with self.lock:
+            now = long(time.time())
+            self.dbConn.setAutoCommit(False)
+            try:
+                columns = ["event_id"] + [column for (column, column_type, path) in self.EVENT_COLUMNS] + ["log_key", "event"]
+                preparedStmt = self.connections.prepare(self.db_path, "INSERT OR IGNORE INTO events (" + ", ".join(columns) + ") VALUES (" + ", ".join(["?"] * len(columns)) + ");")
+                for (key, event) in events:
+                    preparedStmt.setString(1, event.get("eventID"))
+                    for i, (column, column_type, path) in enumerate(self.EVENT_COLUMNS):
+                        value = self.field(event, path)
+                        if column_type == "int":
+                            value = RowMapper.epoch(value)
+                            if value is None:
+                                preparedStmt.setNull(i + 2, Types.INTEGER)
+                            else:
+                                preparedStmt.setLong(i + 2, value)
+                        else:
+                            preparedStmt.setString(i + 2, value)
+                    preparedStmt.setString(len(columns) - 1, key)
+                    preparedStmt.setBytes(len(columns), array.array('b', zlib.compress(json.dumps(event, sort_keys=True))))
+                    preparedStmt.addBatch()
+                preparedStmt.executeBatch()
+
+                preparedStmt = self.connections.prepare(self.db_path, "INSERT OR IGNORE INTO log_objects (bucket, filters, key) VALUES (?, ?, ?);")
+                for (account, region, prefix, log_prefix, key) in log_objects:
+                    preparedStmt.setString(1, self.bucket)
+                    preparedStmt.setString(2, self.filters)
+                    preparedStmt.setString(3, key)
+                    preparedStmt.addBatch()
+                preparedStmt.executeBatch()
+
+                # Each folder's checkpoint moves to the last key all of whose
+                # predecessors are saved
+                saved_keys = self.saved_keys | set([log_object[4] for log_object in log_objects])
+                last_keys = {}
+                for folder in set([log_object[:4] for log_object in log_objects]):
+                    count = 0
+                    for key in self.unsaved.get(folder, []):
+                        if key not in saved_keys:
+                            break
+                        count += 1
+                        last_keys[folder] = (key, count)
+
+                for (account, region, prefix, log_prefix), (key, count) in last_keys.items():
+                    preparedStmt = self.connections.prepare(self.db_path, "INSERT OR REPLACE INTO checkpoint (bucket, account, region, prefix, filters, last_key, updated_time) VALUES (?, ?, ?, ?, ?, MAX(?, COALESCE((SELECT last_key FROM checkpoint WHERE bucket = ? AND account = ? AND region = ? AND prefix = ? AND filters = ?), '')), ?);")
+                    preparedStmt.setString(1, self.bucket)
+                    preparedStmt.setString(2, account)
+                    preparedStmt.setString(3, region)
+                    preparedStmt.setString(4, prefix)
+                    preparedStmt.setString(5, self.filters)
+                    preparedStmt.setString(6, key)
+                    preparedStmt.setString(7, self.bucket)
+                    preparedStmt.setString(8, account)
+                    preparedStmt.setString(9, region)
+                    preparedStmt.setString(10, prefix)
+                    preparedStmt.setString(11, self.filters)
+                    preparedStmt.setLong(12, now)
+                    preparedStmt.executeUpdate()
+
+                    # Objects from before the day being listed again are never looked at again
+                    preparedStmt = self.connections.prepare(self.db_path, "DELETE FROM log_objects WHERE bucket = ? AND filters = ? AND key > ? AND key < ?;")
+                    preparedStmt.setString(1, self.bucket)
+                    preparedStmt.setString(2, self.filters)
+                    preparedStmt.setString(3, log_prefix)
+                    preparedStmt.setString(4, self.day_of(log_prefix, key))
+                    preparedStmt.executeUpdate()
+                self.dbConn.commit()
+            except SQLException:
+                self.dbConn.rollback()
+                raise
+            finally:
+                self.dbConn.setAutoCommit(True)
+
+            for folder, (key, count) in last_keys.items():
+                for i in range(count):
+                    saved_keys.discard(self.unsaved[folder].popleft())
+            self.saved_keys = saved_keys
+
+    # The field of an event at path, as text, or None if it doesn't have it
+    @staticmethod
+    def field(event, path):
+        value = event
+        for name in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(name)
+        if value is None or isinstance(value, unicode):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, sort_keys=True)
+        return unicode(value)
+
+    def close(self):
+        with self.lock:
+            if self.dbConn is not None:
+                self.connections.close(self.db_path)
+                self.dbConn = None
+
+
 # Factory that defines the name and details of the module and allows Autopsy
 # to create instances of the modules that will do the analysis.
 class CloudtopsyIngestModuleFactory(IngestModuleFactoryAdapter):
@@ -88,6 +1064,7 @@ class CloudtopsyIngestModuleFactory(IngestModuleFactoryAdapter):
         self.settings = None
 
     moduleName = "Cloudtopsy"
+    moduleVersion = "1.0"
     
     def getModuleDisplayName(self):
         return self.moduleName
@@ -96,7 +1073,7 @@ class CloudtopsyIngestModuleFactory(IngestModuleFactoryAdapter):
         return "Download and ingest CloudTrail logs from AWS"
     
     def getModuleVersionNumber(self):
-        return "1.0"
+        return self.moduleVersion
     
     def getDefaultIngestJobSettings(self):
         return CloudtopsyWithUISettings()
@@ -122,12 +1099,42 @@ class CloudtopsyIngestModule(DataSourceIngestModule):
     _logger = Logger.getLogger(CloudtopsyIngestModuleFactory.moduleName)
 
     def log(self, level, msg):
-        self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
+        self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name, msg)
+
+    # Artifacts committed to the case database per transaction
+    ARTIFACT_BATCH_SIZE = 1000
+    # Parsed log objects the decompression threads may hold ahead of the ingest thread
+    LOG_QUEUE_SIZE = 16
+    # Threads listing log folders (one account and region each), downloading
+    # log objects and decompressing them. CloudTrail delivers many small
+    # objects, so downloads are bound by latency rather than bandwidth
+    LIST_THREADS = 4
+    DOWNLOAD_THREADS = 8
+    DECOMPRESS_THREADS = 4
+    # Listed log objects waiting for a download thread, and downloaded ones
+    # waiting for a decompression thread
+    KEY_QUEUE_SIZE = 256
+    DATA_QUEUE_SIZE = 32
+    # Every event becomes a TSK_CLOUDTRAIL_EVENT artifact with these
+    # attributes, (column, type, path to the field in the event), and the
+    # key and ETag of the log object it came from. The whole event is only
+    # kept compressed in the events table of the checkpoint database, found
+    # by its eventID
+    EVENT_COLUMNS = [
+        ("eventID", "TEXT", ("eventID",)),
+        ("eventTime", "DATETIME", ("eventTime",)),
+        ("eventName", "TEXT", ("eventName",)),
+        ("eventSource", "TEXT", ("eventSource",)),
+        ("sourceIPAddress", "TEXT", ("sourceIPAddress",)),
+        ("userIdentity_arn", "TEXT", ("userIdentity", "arn")),
+        ("awsRegion", "TEXT", ("awsRegion",)),
+        ("recipientAccountId", "TEXT", ("recipientAccountId",)),
+        ("userAgent", "TEXT", ("userAgent",)),
+        ("errorCode", "TEXT", ("errorCode",))]
 
     def __init__(self, settings):
         self.context = None
         self.local_settings = settings
-        self.List_Of_tables = [] 
 
     # Where any setup and configuration is done
     # 'context' is an instance of org.sleuthkit.autopsy.ingest.IngestJobContext.
@@ -138,16 +1145,36 @@ class CloudtopsyIngestModule(DataSourceIngestModule):
         self.Secret_Key = self.local_settings.getSecretKey()
         self.Region = self.local_settings.getRegion()
         self.Bucket = self.local_settings.getBucket()
+        # The prefix the trail delivers to, in front of AWSLogs/
+        self.Key_Prefix = self.local_settings.getKeyPrefix().strip("/ ")
+        if self.Key_Prefix:
+            self.Key_Prefix = self.Key_Prefix + "/"
+        # Where the logs are read from, in order of precedence: the data
+        # source, a local folder or ZIP file, or the bucket, on AWS or on the
+        # S3-compatible store at the endpoint URL
+        self.Use_Data_Source = self.local_settings.getUseDataSource()
+        self.Local_Path = self.local_settings.getLocalPath().strip()
+        self.Endpoint = self.local_settings.getEndpoint().strip()
 
         #Record Parameters
+        self.log(Level.INFO, "Use_Data_Source: " + str(self.Use_Data_Source))
+        self.log(Level.INFO, "Local_Path: " + str(self.Local_Path))
+        self.log(Level.INFO, "Endpoint: " + str(self.Endpoint))
         self.log(Level.INFO, "Bucket: " + str(self.Bucket))
         self.log(Level.INFO, "Access_Key: " + str(self.Access_Key))
         self.log(Level.INFO, "Secret Key: " + str(self.Secret_Key))
         self.log(Level.INFO, "Region: " + str(self.Region))
+        self.log(Level.INFO, "Key_Prefix: " + str(self.Key_Prefix))
+        self.log(Level.INFO, "Start_Time: " + str(self.local_settings.getStartTime()))
+        self.log(Level.INFO, "End_Time: " + str(self.local_settings.getEndTime()))
+        self.log(Level.INFO, "Accounts: " + str(self.local_settings.getAccounts()))
+        self.log(Level.INFO, "Log_Regions: " + str(self.local_settings.getLogRegions()))
+        self.log(Level.INFO, "Event_Sources: " + str(self.local_settings.getEventSources()))
 
-        self.my_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloudtopsy.exe")
-        if not os.path.exists(self.my_exe):
-            raise IngestModuleException("EXE was not found in module folder")
+        try:
+            self.filter = CloudTrailFilter(self.local_settings.getStartTime(), self.local_settings.getEndTime(), self.local_settings.getAccounts(), self.local_settings.getLogRegions(), self.local_settings.getEventSources())
+        except ValueError as e:
+            raise IngestModuleException(str(e))
 
     # Where the analysis is done.
     # The 'dataSource' object being passed in is of type org.sleuthkit.datamodel.Content.
@@ -156,136 +1183,465 @@ class CloudtopsyIngestModule(DataSourceIngestModule):
     # See: http://sleuthkit.org/autopsy/docs/api-docs/3.1/classorg_1_1sleuthkit_1_1autopsy_1_1ingest_1_1_data_source_ingest_module_progress.html
     def process(self, dataSource, progressBar): 
 
-        # Check if this is Windows
-        if not PlatformUtil.isWindowsOS(): 
-            self.log(Level.INFO, "Ignoring data source.  Not running on Windows")
-            return IngestModule.ProcessResult.OK
-        
+        # The number of log objects isn't known until the bucket has been listed
         progressBar.switchToIndeterminate()
         
         skCase = Case.getCurrentCase().getSleuthkitCase();
+        self.schema = SchemaRegistry.for_case(skCase)
+        self.artifacts = ArtifactWriter(skCase, CloudtopsyIngestModuleFactory.moduleName, self.ARTIFACT_BATCH_SIZE)
+        self.metrics = JobMetrics(CloudtopsyIngestModuleFactory.moduleName, CloudtopsyIngestModuleFactory.moduleVersion)
+        self.metrics.add_rate("artifacts_per_second", "artifacts")
+        self.metrics.add_rate("attributes_per_second", "attributes")
+        self.metrics.add_rate("artifacts_per_write_second", "artifacts", "write")
+        self.metrics.add_rate("objects_per_second", "objects_downloaded", "fetch")
+        self.metrics.add_rate("bytes_per_second", "bytes_downloaded", "fetch")
+        self.event_type = self.schema.artifact_type("TSK_CLOUDTRAIL_EVENT", "CloudTrail Event")
+        Column_Names = [column[0] for column in self.EVENT_COLUMNS] + ["logObjectKey", "logObjectETag"]
+        Column_Types = [column[1] for column in self.EVENT_COLUMNS] + ["TEXT", "TEXT"]
+        self.event_mapper = self.schema.row_mapper(CloudtopsyIngestModuleFactory.moduleName, Column_Names, Column_Types)
         fileManager = Case.getCurrentCase().getServices().getFileManager()
-        
-        # In most Autopsy plugins this is where, the plugins searches for the files it's going to parse (i.e. a Registry hive or Log file)
-        # In this plugin the data were adding to the case comes from outside autopsy, so there isn't really a file to associate the output with
-        # but Autopsy expects the artifacts produced by the plugin to be associated with a file 
-        # So, this plugin just selects the very first file in the dataset, and associates the artifacts with that.
-        files = fileManager.findFiles(dataSource, "%")
-        self.log(Level.INFO, "CloudTrail logs will be associated with " + files[0].getName())
-  
-  
-        Temp_Dir = Case.getCurrentCase().getTempDirectory()
-        self.log(Level.INFO, "Found temporary directory: " + Temp_Dir)
-
-       
-        mydb = Temp_Dir + "\\Cloudtopsy.db"
-        # Parse some keys
-        self.log(Level.INFO, "Downloading and parsing CloudTrail logs: \"" + self.my_exe + "\" -a \"" + self.Access_Key + "\" -s \"" + self.Secret_Key + "\" -r \"" + self.Region + "\" -b \"" + self.Bucket + "\" -d \"" + mydb + "\"")
-        subprocess.Popen([self.my_exe, '-a', self.Access_Key, '-s', self.Secret_Key, '-r', self.Region, '-b', self.Bucket, '-d', mydb]).communicate()[0] 
 
-        try: 
-            Class.forName("org.sqlite.JDBC").newInstance()
-            dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % mydb)
-        except SQLException as e:
-            self.log(Level.INFO, "Could not open database file " + mydb + " (" + e.getMessage() + ")")
-            return IngestModule.ProcessResult.OK
-             
+        try:
+            if self.Use_Data_Source:
+                client = DataSourceLogSource(fileManager, dataSource)
+            elif self.Local_Path:
+                client = LocalLogSource(self.Local_Path)
+            else:
+                client = S3Client(self.Access_Key, self.Secret_Key, self.Region or "us-east-1", self.Bucket, self.Endpoint)
+        except (IOError, TskCoreException) as e:
+            self.log(Level.SEVERE, "Could not open CloudTrail log source (" + str(e) + ")")
+            message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Cloudtopsy", " Could not open CloudTrail log source: " + str(e))
+            IngestServices.getInstance().postMessage(message)
+            return IngestModule.ProcessResult.ERROR
+        # Keys of the offline sources start at AWSLogs/
+        if isinstance(client, S3Client):
+            prefix = self.Key_Prefix
+            client.metrics = self.metrics
+        else:
+            prefix = ""
+        self.log(Level.INFO, "Reading CloudTrail logs from " + client.name)
 
-        # Retrieve a list of CloudTrail APIs called 
+        # Log objects and events that are already in the case are skipped
+        Module_Dir = os.path.join(Case.getCurrentCase().getModuleDirectory(), "Cloudtopsy")
+        if not os.path.exists(Module_Dir):
+            os.makedirs(Module_Dir)
+
+        # The artifacts of each log object are attached to a file for it.
+        # Log files in the data source are already files of the case. Log
+        # objects from anywhere else are saved in the module output folder
+        # and added as derived files, under a Cloudtopsy folder of the data source
+        self.Case_Dir = Case.getCurrentCase().getCaseDirectory()
+        if isinstance(client, DataSourceLogSource):
+            self.Logs_Dir = None
+        else:
+            self.Logs_Dir = os.path.join(Module_Dir, "Logs", re.sub(r"[^\w.-]+", "_", client.name))
+            try:
+                self.log_folder = self.get_log_folder(skCase, dataSource)
+                self.log_files = self.get_log_files(self.log_folder)
+            except TskCoreException as e:
+                self.log(Level.SEVERE, "Could not add the Cloudtopsy folder to the data source (" + e.getMessage() + ")")
+                message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Cloudtopsy", " Could not add the Cloudtopsy folder to the data source " )
+                IngestServices.getInstance().postMessage(message)
+                client.close()
+                return IngestModule.ProcessResult.ERROR
+        self.connections = ConnectionPool()
+        self.checkpoint = CloudTrailCheckpoint(self.connections, os.path.join(Module_Dir, "Cloudtopsy_Checkpoint.db3"), client.name, self.filter.signature())
         try:
-            stmt = dbConn.createStatement()
-            tableSet = stmt.executeQuery("SELECT name from sqlite_master WHERE type='table' ORDER by name; ")
-            self.log(Level.INFO, "SQLite Query: SELECT name from sqlite_master WHERE type='table' ORDER by name;")
+            self.checkpoint.open()
         except SQLException as e:
-            self.log(Level.INFO, "Error Running Query: SELECT name from sqlite_master WHERE type='table' ORDER by name;")
-            return IngestModule.ProcessResult.OK
-        while tableSet.next(): 
-            self.List_Of_tables.append(tableSet.getString("name"))
-          
-        # Retrieve a count of CloudTrail APIs called and use it for the Progress Bar  
+            self.log(Level.INFO, "Could not open checkpoint database in " + Module_Dir + " (" + e.getMessage() + ")")
+            message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Cloudtopsy", " Could not open checkpoint database " )
+            IngestServices.getInstance().postMessage(message)
+            self.connections.close()
+            client.close()
+            return IngestModule.ProcessResult.ERROR
+        self.pending_logs = []
+        self.pending_events = []
+        self.job_events = set()
+        self.failed_batches = 0
+        self.artifacts.committed = self.save_checkpoint
+        self.artifacts.failed = self.discard_checkpoint
+
+        # Log objects are listed, downloaded, decompressed and parsed by pools
+        # of threads while this one turns the events of the parsed objects into
+        # artifacts. Only a few objects are held in memory at a time. Every
+        # source goes through the same pipeline.
+        self.logs = Queue.Queue(self.LOG_QUEUE_SIZE)
+        self.stop = threading.Event()
+        fetcher = threading.Thread(target=self.fetch_logs, args=(client, prefix))
+        fetcher.setDaemon(True)
+        fetcher.start()
         try:
-            stmt = dbConn.createStatement()
-            resultSet = stmt.executeQuery("SELECT COUNT(*) as count FROM Sqlite_Master WHERE type='table'; ")
-            self.log(Level.INFO, "SELECT COUNT(*) as count FROM Sqlite_Master WHERE type='table';")
-        except SQLException as e:
-            self.log(Level.INFO, "SELECT COUNT(*) as count FROM Sqlite_Master WHERE type='table';")
-            return IngestModule.ProcessResult.OK   
-        progressBar.switchToDeterminate(int(resultSet.getString("count")))
-        
-        stmt.close()
-        dbConn.close()
-        
-        
-        # Ingest the tables in mydb in Autopsy
-        count = 0
-        for table_name in self.List_Of_tables:
-            SQL_String_1 = "Select * from " + table_name + ";"
-            SQL_String_2 = "PRAGMA table_info('" + table_name + "')"
-            artifact_name = "TSK_" + table_name.upper()
-            artifact_desc = "CloudTrail: " + table_name.upper()
-
-            artID_amc = skCase.addArtifactType(artifact_name, artifact_desc)
-            artID_amc = skCase.getArtifactTypeID(artifact_name)
-            artID_amc_evt = skCase.getArtifactType(artifact_name)
-            
+            result = self.write_logs(skCase, client, progressBar)
+        finally:
+            # Stop the pipeline however write_logs ended, so no thread is left
+            # waiting for room on a queue nobody reads any more
+            self.stop.set()
+            while True:
+                try:
+                    self.logs.get_nowait()
+                except Queue.Empty:
+                    break
+            fetcher.join()
+            self.checkpoint.close()
+            self.connections.close()
+            client.close()
+            # Reported even when the job failed, when they are needed most.
+            # Guarded so a problem here doesn't hide the one that ended the job
             try:
-                Class.forName("org.sqlite.JDBC").newInstance()
-                dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % mydb)
-                stmt = dbConn.createStatement()
-            except SQLException as e:
-                return IngestModule.ProcessResult.OK
-                       
-            Column_Names = []
-            Column_Types = []
-            self.log(Level.INFO, "Running Query: " + SQL_String_2)
-            resultSet2  = stmt.executeQuery(SQL_String_2)
-            while resultSet2.next(): 
-                Column_Names.append(resultSet2.getString("name").upper())
-                Column_Types.append(resultSet2.getString("type").upper())
-                if resultSet2.getString("type").upper() == "TEXT":
-                    try:
-                        attID_ex1 = skCase.addArtifactAttributeType("TSK_" + resultSet2.getString("name").upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING, resultSet2.getString("name"))
-                    except:
-                        self.log(Level.INFO, "Attributes Creation Error (string), " + resultSet2.getString("name") + " ==> ")
-                elif resultSet2.getString("type").upper() == "":
-                    try:
-                        attID_ex1 = skCase.addArtifactAttributeType("TSK_" + resultSet2.getString("name").upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.STRING, resultSet2.getString("name"))
-                    except:        
-                        self.log(Level.INFO, "Attributes Creation Error (string2), " + resultSet2.getString("name") + " ==> ")
-                else:
-                    try:
-                        attID_ex1 = skCase.addArtifactAttributeType("TSK_" + resultSet2.getString("name").upper(), BlackboardAttribute.TSK_BLACKBOARD_ATTRIBUTE_VALUE_TYPE.LONG, resultSet2.getString("name"))
-                    except:        
-                        self.log(Level.INFO, "Attributes Creation Error (long), " + resultSet2.getString("name") + " ==> ")
-
-            self.log(Level.INFO, "Running Query: " + SQL_String_1)                                
-            resultSet3 = stmt.executeQuery(SQL_String_1)
-            while resultSet3.next():
-                art = files[0].newArtifact(artID_amc)
-                Column_Number = 1
-                for col_name in Column_Names:  
-                    c_name = "TSK_" + col_name
-                    attID_ex1 = skCase.getAttributeType(c_name)
-                    if Column_Types[Column_Number - 1] == "TEXT":
-                        art.addAttribute(BlackboardAttribute(attID_ex1, CloudtopsyIngestModuleFactory.moduleName, resultSet3.getString(Column_Number)))
-                    elif Column_Types[Column_Number - 1] == "":
-                        art.addAttribute(BlackboardAttribute(attID_ex1, CloudtopsyIngestModuleFactory.moduleName, resultSet3.getString(Column_Number)))
-                    else:
-                        art.addAttribute(BlackboardAttribute(attID_ex1, CloudtopsyIngestModuleFactory.moduleName, long(resultSet3.getInt(Column_Number))))
-                    Column_Number = Column_Number + 1
-            
-            IngestServices.getInstance().fireModuleDataEvent(ModuleDataEvent(CloudtopsyIngestModuleFactory.moduleName, artID_amc_evt, None))
-            stmt.close()
-            dbConn.close()
-            count += 1
-            progressBar.progress(count)              
-                   
-
+                self.report_metrics(dataSource)
+            except:
+                self.log(Level.WARNING, "Could not report the metrics (" + str(sys.exc_info()[1]) + ")")
+        if result is not None:
+            return result
 
         message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Cloudtopsy", " CloudTrail Logs Successfully Ingested!" ) 
         IngestServices.getInstance().postMessage(message)
         return IngestModule.ProcessResult.OK
-        
+
+    # Create the artifacts for each parsed log object as it comes off the queue.
+    # Returns a ProcessResult if the job has to stop early, otherwise None
+    def write_logs(self, skCase, client, progressBar):
+        num_logs = 0
+        num_events = 0
+        num_duplicates = 0
+        while True:
+
+            # Check if the user pressed cancel while we were busy
+            if self.context.isJobCancelled():
+                return IngestModule.ProcessResult.OK
+
+            try:
+                log = self.logs.get(True, 1)
+            except Queue.Empty:
+                continue
+            if log is None:
+                break
+            if log[0] == "error":
+                message = IngestMessage.createMessage(IngestMessage.MessageType.DATA, "Cloudtopsy", " Error downloading CloudTrail logs: " + log[1])
+                IngestServices.getInstance().postMessage(message)
+                continue
+
+            log_object, etag, events = log
+            event_ids = [event["eventID"] for event in events if event.get("eventID")]
+            try:
+                known = self.checkpoint.known_events(event_ids)
+            except SQLException as e:
+                self.log(Level.INFO, "Error reading the checkpoint database (" + e.getMessage() + ")")
+                known = set()
+            new_events = []
+            for event in events:
+                event_id = event.get("eventID")
+                if event_id:
+                    if event_id in known or event_id in self.job_events:
+                        num_duplicates += 1
+                        continue
+                    self.job_events.add(event_id)
+                new_events.append(event)
+            if new_events:
+                try:
+                    file = self.log_file(skCase, client, log_object[4], etag)
+                except (TskCoreException, OSError) as e:
+                    # Not saved, so the next run tries it again
+                    self.log(Level.SEVERE, "Could not add log object " + log_object[4] + " to the case (" + str(e) + ")")
+                    continue
+            failed_batches = self.failed_batches
+            for event in new_events:
+                self.pending_events.append((log_object[4], event))
+                try:
+                    self.add_event(file, event, log_object[4], etag)
+                except TskCoreException as e:
+                    self.log(Level.SEVERE, "Could not commit a batch of CloudTrail Event artifacts (" + str(e) + ")")
+                num_events += 1
+            # A log object is only done once all of its events are committed
+            if self.failed_batches == failed_batches:
+                self.pending_logs.append(log_object)
+            num_logs += 1
+            progressBar.progress(str(num_logs) + " log objects, " + str(num_events) + " events")
+
+        try:
+            self.artifacts.flush()
+        except TskCoreException as e:
+            self.log(Level.SEVERE, "Could not commit a batch of CloudTrail Event artifacts (" + str(e) + ")")
+        self.save_checkpoint()
+        self.log(Level.INFO, "Ingested " + str(num_events) + " events from " + str(num_logs) + " new log objects, skipped " + str(num_duplicates) + " events already in the case")
+        self.metrics.count("events", num_events)
+        self.metrics.count("duplicate_events", num_duplicates)
+        return None
+
+    # Post the metrics of the job as an ingest message and save them as JSON
+    # in the module output folder, one file per job
+    def report_metrics(self, dataSource):
+        self.metrics.finish()
+        self.metrics.count("artifacts", self.artifacts.written)
+        self.metrics.count("attributes", self.artifacts.attributes_written)
+        self.metrics.add_time("write", self.artifacts.seconds)
+        message = IngestMessage.createMessage(IngestMessage.MessageType.INFO, "Cloudtopsy", " Ingest Metrics ", self.metrics.summary())
+        IngestServices.getInstance().postMessage(message)
+        Module_Dir = os.path.join(Case.getCurrentCase().getModuleDirectory(), "Cloudtopsy")
+        Metrics_File = os.path.join(Module_Dir, "Metrics_" + time.strftime("%Y%m%d_%H%M%S", time.localtime(self.metrics.started)) + "_" + str(dataSource.getId()) + ".json")
+        try:
+            self.metrics.save(Metrics_File, dataSource.getName())
+            self.log(Level.INFO, "Metrics saved to " + Metrics_File)
+        except (IOError, OSError) as e:
+            self.log(Level.WARNING, "Could not save the metrics to " + Metrics_File + " (" + str(e) + ")")
+
+    # Record the log objects and events whose artifacts have been committed
+    def save_checkpoint(self):
+        try:
+            self.checkpoint.save(self.pending_logs, self.pending_events)
+        except SQLException as e:
+            self.log(Level.INFO, "Error writing the checkpoint database (" + e.getMessage() + ")")
+        self.pending_logs = []
+        self.pending_events = []
+
+    # Forget the log objects and events of a batch whose commit failed, so the
+    # next run fetches them again
+    def discard_checkpoint(self, dropped):
+        for (key, event) in self.pending_events:
+            self.job_events.discard(event.get("eventID"))
+        self.metrics.count("failed_events", len(self.pending_events))
+        self.failed_batches += 1
+        self.pending_logs = []
+        self.pending_events = []
+
+    # Fetch thread: run the log objects under prefix through the pipeline
+    #  - a pool of threads lists the log folders, one account and region at a
+    #    time, for the objects in the time window and newer than the checkpoint,
+    #  - a pool of threads downloads them,
+    #  - a pool of threads decompresses and parses them and puts the events
+    #    that pass the filter on the queue of the ingest thread.
+    # Each stage hands over through a bounded queue and is stopped once the
+    # one before it is done. None goes on the queue last
+    def fetch_logs(self, client, prefix):
+        started = time.time()
+        try:
+            folder_queue = Queue.Queue()
+            for (account, region, log_prefix) in self.find_log_prefixes(client, prefix):
+                if self.filter.keep_folder(account, region):
+                    folder_queue.put((account, region, log_prefix))
+            self.metrics.add_time("list_folders", time.time() - started)
+            self.metrics.count("log_folders", folder_queue.qsize())
+        except (IOError, SyntaxError) as e:
+            self.log(Level.SEVERE, "Could not list " + client.name + " (" + str(e) + ")")
+            self.queue_put(self.logs, ("error", str(e)))
+            self.queue_put(self.logs, None)
+            return
+
+        self.keys = Queue.Queue(self.KEY_QUEUE_SIZE)
+        self.downloads = Queue.Queue(self.DATA_QUEUE_SIZE)
+        num_listers = max(1, min(folder_queue.qsize(), self.LIST_THREADS))
+        num_decompressors = max(1, min(self.DECOMPRESS_THREADS, Runtime.getRuntime().availableProcessors()))
+        self.log(Level.INFO, "Fetching " + str(folder_queue.qsize()) + " log folders with " + str(num_listers) + " listing, " + str(self.DOWNLOAD_THREADS) + " download and " + str(num_decompressors) + " decompression threads")
+        stages = [(self.list_logs, (client, prefix, folder_queue), num_listers, self.keys),
+                  (self.download_logs, (client,), self.DOWNLOAD_THREADS, self.downloads),
+                  (self.decompress_logs, (), num_decompressors, None)]
+        pools = []
+        for (target, args, num_threads, output) in stages:
+            threads = []
+            for i in range(num_threads):
+                thread = threading.Thread(target=target, args=args)
+                thread.setDaemon(True)
+                thread.start()
+                threads.append(thread)
+            pools.append(threads)
+        try:
+            for stage in range(len(stages)):
+                for thread in pools[stage]:
+                    thread.join()
+                # One None per thread of the next stage
+                if stage + 1 < len(stages):
+                    for thread in pools[stage + 1]:
+                        self.queue_put(stages[stage][3], None)
+        finally:
+            self.metrics.add_time("fetch", time.time() - started)
+            self.queue_put(self.logs, None)
+
+    # Listing thread: list the log folders off folder_queue until it is empty
+    # and queue their new log objects for download, in key order
+    def list_logs(self, client, prefix, folder_queue):
+        while not self.stopping():
+            try:
+                (account, region, log_prefix) = folder_queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                start_after, processed = self.checkpoint.start(account, region, prefix, log_prefix)
+                first_key = self.filter.first_key(log_prefix)
+                if first_key is not None and (start_after is None or first_key > start_after):
+                    start_after = first_key
+                self.log(Level.INFO, "Listing " + log_prefix + " after " + str(start_after))
+                for (key, size, etag) in client.list_objects(log_prefix, start_after):
+                    if self.stopping():
+                        return
+                    if self.filter.past_end(log_prefix, key):
+                        break
+                    # Skip anything that isn't a log, and logs from an earlier run
+                    if not key.endswith(".json.gz") or key in processed:
+                        continue
+                    log_object = (account, region, prefix, log_prefix, key)
+                    self.metrics.count("objects_listed")
+                    self.checkpoint.listed(log_object)
+                    if not self.queue_put(self.keys, (log_object, etag)):
+                        return
+            except (IOError, SyntaxError, SQLException) as e:
+                self.log(Level.SEVERE, "Could not list " + log_prefix + " in " + client.name + " (" + str(e) + ")")
+                self.queue_put(self.logs, ("error", str(e)))
+
+    # Download thread: download the log objects off the key queue until a
+    # None, and save a copy of each one unless it is in the data source
+    def download_logs(self, client):
+        while True:
+            listed = self.queue_get(self.keys)
+            if listed is None:
+                return
+            log_object, etag = listed
+            started = time.time()
+            try:
+                data = client.get_object(log_object[4])
+                self.metrics.observe("download", time.time() - started)
+                if self.Logs_Dir is not None:
+                    self.save_copy(log_object[4], data)
+            except (IOError, OSError, ValueError, TypeError, AttributeError) as e:
+                # Not saved, so the checkpoint stays before it and the next run tries it again
+                self.log(Level.WARNING, "Could not download log object " + log_object[4] + " (" + str(e) + ")")
+                self.metrics.count("download_failures")
+                continue
+            self.metrics.count("objects_downloaded")
+            self.metrics.count("bytes_downloaded", len(data))
+            if not self.queue_put(self.downloads, (log_object, etag, data)):
+                return
+
+    # Write the copy of a log object to the module output folder, under its key
+    def save_copy(self, key, data):
+        path = self.copy_path(key)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # Another download thread may have made the folder first
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+        copy = open(path, "wb")
+        try:
+            copy.write(data)
+        finally:
+            copy.close()
+
+    def copy_path(self, key):
+        return os.path.join(self.Logs_Dir, *key.split("/"))
+
+    # Decompression thread: parse the downloaded log objects until a None and
+    # queue the events of each one that pass the filter
+    def decompress_logs(self):
+        while True:
+            download = self.queue_get(self.downloads)
+            if download is None:
+                return
+            log_object, etag, data = download
+            started = time.time()
+            # Anything wrong with one log object (a corrupt gzip stream, JSON
+            # that isn't a CloudTrail log) only skips that object, this thread
+            # has to keep draining the download queue
+            try:
+                events = self.read_log(data)
+                num_events = len(events)
+                # Records that aren't objects are no events
+                events = [event for event in events if isinstance(event, dict) and self.filter.keep_event(event)]
+            except (IOError, ValueError, zlib.error, TypeError, AttributeError) as e:
+                self.log(Level.WARNING, "Could not read log object " + log_object[4] + " (" + str(e) + ")")
+                self.metrics.count("unreadable_objects")
+                continue
+            self.metrics.add_time("decompress", time.time() - started)
+            self.metrics.count("events_read", num_events)
+            if not self.queue_put(self.logs, (log_object, etag, events)):
+                return
+
+    # Yield the (account, region, log prefix) of each CloudTrail log folder,
+    # <prefix>AWSLogs/<account>/CloudTrail/<region>/, in the bucket.
+    # Organization trails add the organization ID before the account.
+    def find_log_prefixes(self, client, prefix):
+        account_prefixes = []
+        for account_prefix in client.list_prefixes(prefix + "AWSLogs/"):
+            if account_prefix.split("/")[-2].startswith("o-"):
+                account_prefixes.extend(client.list_prefixes(account_prefix))
+            else:
+                account_prefixes.append(account_prefix)
+        for account_prefix in account_prefixes:
+            for log_prefix in client.list_prefixes(account_prefix + "CloudTrail/"):
+                yield (account_prefix.split("/")[-2], log_prefix.split("/")[-2], log_prefix)
+
+    # True once the job is cancelled or the ingest thread has stopped reading
+    def stopping(self):
+        return self.stop.isSet() or self.context.isJobCancelled()
+
+    # Put an item on a bounded queue, waiting for room. Returns False if the job is stopping
+    def queue_put(self, queue, item):
+        while True:
+            if self.stopping():
+                return False
+            try:
+                queue.put(item, True, 1)
+                return True
+            except Queue.Full:
+                continue
+
+    # Take an item off a queue, waiting for one. Returns None if the job is stopping
+    def queue_get(self, queue):
+        while True:
+            if self.stopping():
+                return None
+            try:
+                return queue.get(True, 1)
+            except Queue.Empty:
+                continue
+
+    # Decompress a CloudTrail log object and return its list of events
+    def read_log(self, data):
+        log = json.loads(gzip.GzipFile(fileobj=StringIO.StringIO(data)).read())
+        return log.get("Records", [])
+
+    # Return the Cloudtopsy folder of the data source, adding it the first time.
+    # Only the top level of the data source is looked at
+    def get_log_folder(self, skCase, dataSource):
+        for child in dataSource.getChildren():
+            if isinstance(child, VirtualDirectory) and child.getName() == "Cloudtopsy":
+                return child
+        return skCase.addVirtualDirectory(dataSource.getId(), "Cloudtopsy")
+
+    # Return the derived files an earlier run added to the Cloudtopsy folder,
+    # by name and local path
+    def get_log_files(self, log_folder):
+        log_files = {}
+        for child in log_folder.getChildren():
+            if child.getLocalPath():
+                log_files[(child.getName(), os.path.normpath(child.getLocalPath()))] = child
+        return log_files
+
+    # Return the file the artifacts of a log object are attached to: the log
+    # file itself if it is in the data source, otherwise a derived file for
+    # the copy saved by the download thread, recording where it came from.
+    # A copy already added by an earlier run is not added again
+    def log_file(self, skCase, client, key, etag):
+        if self.Logs_Dir is None:
+            return client.files[key]
+        path = self.copy_path(key)
+        name = key.split("/")[-1]
+        local_path = os.path.relpath(path, self.Case_Dir)
+        file = self.log_files.get((name, os.path.normpath(local_path)))
+        if file is not None:
+            return file
+        details = client.name + "/" + key
+        if etag:
+            details = details + " (ETag " + etag + ")"
+        file = skCase.addDerivedFile(name, local_path, os.path.getsize(path), 0, 0, 0, 0, True, self.log_folder, details, CloudtopsyIngestModuleFactory.moduleName, CloudtopsyIngestModuleFactory.moduleVersion, "", TskData.EncodingType.NONE)
+        self.log_files[(name, os.path.normpath(local_path))] = file
+        return file
+
+    # Create the TSK_CLOUDTRAIL_EVENT artifact of one event
+    def add_event(self, file, event, key, etag):
+        row = [CloudTrailCheckpoint.field(event, path) for (column, column_type, path) in self.EVENT_COLUMNS]
+        row.extend([key, etag])
+        self.artifacts.add(file, self.event_type, self.event_mapper.attributes(row))
 
 
 # Stores the settings that can be changed for each ingest job
@@ -299,6 +1655,15 @@ class CloudtopsyWithUISettings(IngestModuleIngestJobSettings):
         self.Secret_Key = ""
         self.Region = ""
         self.Bucket = ""
+        self.Key_Prefix = ""
+        self.Start_Time = ""
+        self.End_Time = ""
+        self.Accounts = ""
+        self.Log_Regions = ""
+        self.Event_Sources = ""
+        self.Endpoint = ""
+        self.Local_Path = ""
+        self.Use_Data_Source = False
 
     def getVersionNumber(self):
         return serialVersionUID
@@ -327,6 +1692,60 @@ class CloudtopsyWithUISettings(IngestModuleIngestJobSettings):
 
     def setBucket(self, data):
         self.Bucket = data
+
+    def getKeyPrefix(self):
+        return self.Key_Prefix
+
+    def setKeyPrefix(self, data):
+        self.Key_Prefix = data
+
+    def getStartTime(self):
+        return self.Start_Time
+
+    def setStartTime(self, data):
+        self.Start_Time = data
+
+    def getEndTime(self):
+        return self.End_Time
+
+    def setEndTime(self, data):
+        self.End_Time = data
+
+    def getAccounts(self):
+        return self.Accounts
+
+    def setAccounts(self, data):
+        self.Accounts = data
+
+    def getLogRegions(self):
+        return self.Log_Regions
+
+    def setLogRegions(self, data):
+        self.Log_Regions = data
+
+    def getEventSources(self):
+        return self.Event_Sources
+
+    def setEventSources(self, data):
+        self.Event_Sources = data
+
+    def getEndpoint(self):
+        return self.Endpoint
+
+    def setEndpoint(self, data):
+        self.Endpoint = data
+
+    def getLocalPath(self):
+        return self.Local_Path
+
+    def setLocalPath(self, data):
+        self.Local_Path = data
+
+    def getUseDataSource(self):
+        return self.Use_Data_Source
+
+    def setUseDataSource(self, data):
+        self.Use_Data_Source = data
         
 # UI that is shown to user for each ingest job so they can configure the job.
 # TODO: Rename this
@@ -354,7 +1773,6 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         settings_db = head + "\\config.db"
         
         try: 
-            Class.forName("org.sqlite.JDBC").newInstance()
             dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % settings_db)
         except SQLException as e:
             self.Error_Message.setText("Error Opening Settings DB!")
@@ -378,6 +1796,33 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
                     if resultSet.getString("Key_Name") == "AWS_REGION":
                         self.local_settings.setRegion(resultSet.getString("Key_Value"))
                         self.Region_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "KEY_PREFIX":
+                        self.local_settings.setKeyPrefix(resultSet.getString("Key_Value"))
+                        self.Key_Prefix_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "START_TIME":
+                        self.local_settings.setStartTime(resultSet.getString("Key_Value"))
+                        self.Start_Time_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "END_TIME":
+                        self.local_settings.setEndTime(resultSet.getString("Key_Value"))
+                        self.End_Time_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "ACCOUNTS":
+                        self.local_settings.setAccounts(resultSet.getString("Key_Value"))
+                        self.Accounts_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "LOG_REGIONS":
+                        self.local_settings.setLogRegions(resultSet.getString("Key_Value"))
+                        self.Log_Regions_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "EVENT_SOURCES":
+                        self.local_settings.setEventSources(resultSet.getString("Key_Value"))
+                        self.Event_Sources_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "ENDPOINT":
+                        self.local_settings.setEndpoint(resultSet.getString("Key_Value"))
+                        self.Endpoint_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "LOCAL_PATH":
+                        self.local_settings.setLocalPath(resultSet.getString("Key_Value"))
+                        self.Local_Path_TF.setText(resultSet.getString("Key_Value"))
+                    if resultSet.getString("Key_Name") == "USE_DATA_SOURCE":
+                        self.local_settings.setUseDataSource(resultSet.getString("Key_Value") == "true")
+                        self.Data_Source_CB.setSelected(resultSet.getString("Key_Value") == "true")
                 self.Error_Message.setText("Settings Read successfully!")
             except SQLException as e:
                 self.Error_Message.setText("Error Reading Settings Database")
@@ -402,7 +1847,6 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         head, tail = os.path.split(os.path.abspath(__file__)) 
         settings_db = head + "\\config.db"
         try: 
-            Class.forName("org.sqlite.JDBC").newInstance()
             dbConn = DriverManager.getConnection("jdbc:sqlite:%s"  % settings_db)
         except SQLException as e:
             self.Error_Message.setText("Error Opening Settings")
@@ -414,7 +1858,13 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         except:
             pass
 
-        if re.match(r'[A-Z0-9]{20}', self.Access_Key_TF.getText()):
+        # The keys and region are only checked against the AWS formats when
+        # the logs are read from AWS. Other S3-compatible stores have their
+        # own, and the offline sources need none
+        offline = self.Data_Source_CB.isSelected() or self.Local_Path_TF.getText().strip() != ""
+        aws = not offline and self.Endpoint_TF.getText().strip() == ""
+
+        if not aws or re.match(r'[A-Z0-9]{20}', self.Access_Key_TF.getText()):
             try:
                 stmt = dbConn.createStatement()
                 SQL_Statement = 'UPDATE CONFIG SET Key_Value = "' + self.Access_Key_TF.getText() + '" WHERE Key_Name = "ACCESS_KEY";'
@@ -425,7 +1875,7 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
             error = True
             self.Error_Message.setText("Access Key Invalid")
         
-        if re.match(r'[A-Za-z0-9/+=]{40}', self.Secret_Key_TF.getText()):
+        if not aws or re.match(r'[A-Za-z0-9/+=]{40}', self.Secret_Key_TF.getText()):
             try:
                 stmt = dbConn.createStatement()
                 SQL_Statement = 'UPDATE CONFIG SET Key_Value = "' + self.Secret_Key_TF.getText() + '" WHERE Key_Name = "SECRET_KEY";'
@@ -436,7 +1886,7 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
             error = True
             self.Error_Message.setText("Secret Key Invalid")
         
-        if re.match(r'[a-z]{2}-(gov-)?(north|south|east|west|central)(east|west)?-\d(\w)?', self.Region_TF.getText()): 
+        if not aws or re.match(r'[a-z]{2}-(gov-)?(north|south|east|west|central)(east|west)?-\d(\w)?', self.Region_TF.getText()): 
             try:
                 stmt = dbConn.createStatement()
                 SQL_Statement = 'UPDATE CONFIG SET Key_Value = "' + self.Region_TF.getText() + '" WHERE Key_Name = "AWS_REGION";'
@@ -446,6 +1896,57 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         else: 
             error = True
             self.Error_Message.setText("AWS Region Invalid")
+
+        # The filters are optional, CONFIG may not have rows for them yet
+        try:
+            CloudTrailFilter(self.Start_Time_TF.getText(), self.End_Time_TF.getText(), self.Accounts_TF.getText(), self.Log_Regions_TF.getText(), self.Event_Sources_TF.getText())
+        except ValueError as e:
+            error = True
+            self.Error_Message.setText(str(e))
+        else:
+            self.local_settings.setKeyPrefix(self.Key_Prefix_TF.getText())
+            self.local_settings.setStartTime(self.Start_Time_TF.getText())
+            self.local_settings.setEndTime(self.End_Time_TF.getText())
+            self.local_settings.setAccounts(self.Accounts_TF.getText())
+            self.local_settings.setLogRegions(self.Log_Regions_TF.getText())
+            self.local_settings.setEventSources(self.Event_Sources_TF.getText())
+            try:
+                for key_name, key_value in [("KEY_PREFIX", self.Key_Prefix_TF.getText()), ("START_TIME", self.Start_Time_TF.getText()), ("END_TIME", self.End_Time_TF.getText()), ("ACCOUNTS", self.Accounts_TF.getText()), ("LOG_REGIONS", self.Log_Regions_TF.getText()), ("EVENT_SOURCES", self.Event_Sources_TF.getText())]:
+                    preparedStmt = dbConn.prepareStatement("DELETE FROM CONFIG WHERE Key_Name = ?;")
+                    preparedStmt.setString(1, key_name)
+                    preparedStmt.executeUpdate()
+                    preparedStmt.close()
+                    preparedStmt = dbConn.prepareStatement("INSERT INTO CONFIG (Key_Name, Key_Value) VALUES (?, ?);")
+                    preparedStmt.setString(1, key_name)
+                    preparedStmt.setString(2, key_value)
+                    preparedStmt.executeUpdate()
+                    preparedStmt.close()
+            except SQLException as e:
+                error = True
+                self.Error_Message.setText("Error Saving Filter Settings")
+
+        # The source settings are optional too
+        if self.Local_Path_TF.getText().strip() and not os.path.exists(self.Local_Path_TF.getText().strip()):
+            error = True
+            self.Error_Message.setText("Local Logs Folder or ZIP File Not Found")
+        else:
+            self.local_settings.setEndpoint(self.Endpoint_TF.getText())
+            self.local_settings.setLocalPath(self.Local_Path_TF.getText())
+            self.local_settings.setUseDataSource(self.Data_Source_CB.isSelected())
+            try:
+                for key_name, key_value in [("ENDPOINT", self.Endpoint_TF.getText()), ("LOCAL_PATH", self.Local_Path_TF.getText()), ("USE_DATA_SOURCE", str(self.Data_Source_CB.isSelected()).lower())]:
+                    preparedStmt = dbConn.prepareStatement("DELETE FROM CONFIG WHERE Key_Name = ?;")
+                    preparedStmt.setString(1, key_name)
+                    preparedStmt.executeUpdate()
+                    preparedStmt.close()
+                    preparedStmt = dbConn.prepareStatement("INSERT INTO CONFIG (Key_Name, Key_Value) VALUES (?, ?);")
+                    preparedStmt.setString(1, key_name)
+                    preparedStmt.setString(2, key_value)
+                    preparedStmt.executeUpdate()
+                    preparedStmt.close()
+            except SQLException as e:
+                error = True
+                self.Error_Message.setText("Error Saving Source Settings")
             
         if not error:
             self.Error_Message.setText("Settings Saved")
@@ -619,11 +2120,349 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         self.panel0.add( self.Blank_4 ) 
 
 
+        self.LabelE = JLabel("S3 Key Prefix (optional):")
+        self.LabelE.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 17 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelE, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelE ) 
+
+        self.Key_Prefix_TF = JTextField(20) 
+        self.Key_Prefix_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 19 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Key_Prefix_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Key_Prefix_TF ) 
+
+        self.Blank_5 = JLabel( " ") 
+        self.Blank_5.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 20 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_5, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_5 ) 
+
+        self.LabelF = JLabel("Start Time, UTC YYYY-MM-DD [HH:MM] (optional):")
+        self.LabelF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 21 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelF, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelF ) 
+
+        self.Start_Time_TF = JTextField(20) 
+        self.Start_Time_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 23 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Start_Time_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Start_Time_TF ) 
+
+        self.Blank_6 = JLabel( " ") 
+        self.Blank_6.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 24 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_6, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_6 ) 
+
+        self.LabelG = JLabel("End Time, UTC YYYY-MM-DD [HH:MM] (optional):")
+        self.LabelG.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 25 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelG, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelG ) 
+
+        self.End_Time_TF = JTextField(20) 
+        self.End_Time_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 27 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.End_Time_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.End_Time_TF ) 
+
+        self.Blank_7 = JLabel( " ") 
+        self.Blank_7.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 28 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_7, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_7 ) 
+
+        self.LabelH = JLabel("Account IDs, comma separated (optional):")
+        self.LabelH.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 29 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelH, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelH ) 
+
+        self.Accounts_TF = JTextField(20) 
+        self.Accounts_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 31 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Accounts_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Accounts_TF ) 
+
+        self.Blank_8 = JLabel( " ") 
+        self.Blank_8.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 32 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_8, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_8 ) 
+
+        self.LabelI = JLabel("Log Regions, comma separated (optional):")
+        self.LabelI.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 33 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelI, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelI ) 
+
+        self.Log_Regions_TF = JTextField(20) 
+        self.Log_Regions_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 35 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Log_Regions_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Log_Regions_TF ) 
+
+        self.Blank_9 = JLabel( " ") 
+        self.Blank_9.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 36 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_9, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_9 ) 
+
+        self.LabelJ = JLabel("Event Sources, comma separated (optional):")
+        self.LabelJ.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 37 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelJ, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelJ ) 
+
+        self.Event_Sources_TF = JTextField(20) 
+        self.Event_Sources_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 39 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Event_Sources_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Event_Sources_TF ) 
+
+        self.Blank_11 = JLabel( " ") 
+        self.Blank_11.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 40 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_11, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_11 ) 
+
+        self.LabelK = JLabel("S3-Compatible Endpoint URL, e.g. http://localhost:9000 (optional):")
+        self.LabelK.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 41 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelK, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelK ) 
+
+        self.Endpoint_TF = JTextField(20) 
+        self.Endpoint_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 43 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Endpoint_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Endpoint_TF ) 
+
+        self.Blank_12 = JLabel( " ") 
+        self.Blank_12.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 44 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_12, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_12 ) 
+
+        self.LabelL = JLabel("Local Logs Folder or ZIP File (optional):")
+        self.LabelL.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 45 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.LabelL, self.gbcPanel0 ) 
+        self.panel0.add( self.LabelL ) 
+
+        self.Local_Path_TF = JTextField(20) 
+        self.Local_Path_TF.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 47 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Local_Path_TF, self.gbcPanel0 ) 
+        self.panel0.add( self.Local_Path_TF ) 
+
+        self.Blank_13 = JLabel( " ") 
+        self.Blank_13.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 48 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_13, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_13 ) 
+
+        self.Data_Source_CB = JCheckBox("Read Logs From the Data Source")
+        self.Data_Source_CB.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 49 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Data_Source_CB, self.gbcPanel0 ) 
+        self.panel0.add( self.Data_Source_CB ) 
+
+        self.Blank_10 = JLabel( " ") 
+        self.Blank_10.setEnabled(True)
+        self.gbcPanel0.gridx = 2 
+        self.gbcPanel0.gridy = 50 
+        self.gbcPanel0.gridwidth = 1 
+        self.gbcPanel0.gridheight = 1 
+        self.gbcPanel0.fill = GridBagConstraints.BOTH 
+        self.gbcPanel0.weightx = 1 
+        self.gbcPanel0.weighty = 0 
+        self.gbcPanel0.anchor = GridBagConstraints.NORTH 
+        self.gbPanel0.setConstraints( self.Blank_10, self.gbcPanel0 ) 
+        self.panel0.add( self.Blank_10 ) 
+
         self.Save_Settings_BTN = JButton( "Save Settings", actionPerformed=self.SaveSettings) 
         self.Save_Settings_BTN.setEnabled(True)
         self.rbgPanel0.add( self.Save_Settings_BTN ) 
         self.gbcPanel0.gridx = 2 
-        self.gbcPanel0.gridy = 17
+        self.gbcPanel0.gridy = 51
         self.gbcPanel0.gridwidth = 1 
         self.gbcPanel0.gridheight = 1 
         self.gbcPanel0.fill = GridBagConstraints.BOTH 
@@ -636,7 +2475,7 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         self.Label_1 = JLabel( "Error Message:") 
         self.Label_1.setEnabled(True)
         self.gbcPanel0.gridx = 2 
-        self.gbcPanel0.gridy = 18
+        self.gbcPanel0.gridy = 52
         self.gbcPanel0.gridwidth = 1 
         self.gbcPanel0.gridheight = 1 
         self.gbcPanel0.fill = GridBagConstraints.BOTH 
@@ -649,7 +2488,7 @@ class CloudtopsyWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
         self.Error_Message = JLabel( "") 
         self.Error_Message.setEnabled(True)
         self.gbcPanel0.gridx = 6
-        self.gbcPanel0.gridy = 19
+        self.gbcPanel0.gridy = 53
         self.gbcPanel0.gridwidth = 1 
         self.gbcPanel0.gridheight = 1 
         self.gbcPanel0.fill = GridBagConstraints.BOTH 